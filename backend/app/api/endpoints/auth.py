@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from typing import Any
 from jose import JWTError, jwt
@@ -117,7 +118,7 @@ async def register(user: UserCreate):
             }
             
             print(f"Inserting user into SQLite table: {new_user}")
-            response = db.table('users').insert(new_user).execute()
+            response = await run_in_threadpool(db.table('users').insert(new_user).execute)
             print(f"Insert response: {response.data}")
             
             if not response.data:
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks
 from typing import List, Dict, Any
 from uuid import UUID
 from datetime import datetime
+import json
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from app.db.sqlite_db import get_sqlite_client
 from app.api.endpoints.auth import get_current_user
 from app.models.chat import Conversation, Message, ConversationCreate
-from app.services.llm import process_chat_message
+from app.services.llm import process_chat_message, stream_chat_message
+from app.services.conversation_memory import load_history, update_rolling_summary
 
 router = APIRouter()
 
@@ -31,7 +36,7 @@ async def create_conversation(conversation: ConversationCreate):
         "is_active": 1  # Using integers for booleans in SQLite
     }
     
-    response = db.table('conversations').insert(new_conversation).execute()
+    response = await run_in_threadpool(db.table('conversations').insert(new_conversation).execute)
     
     if not response.data:
         raise HTTPException(
@@ -41,13 +46,15 @@ async def create_conversation(conversation: ConversationCreate):
     
     return {**response.data[0], "messages": []}
 
-@router.post("/message/{conversation_id}", response_model=Message)
-async def send_message(
-    conversation_id: UUID,
-    message: Dict[str, Any] = Body(...),
-):
-    db = get_sqlite_client()
+def _begin_message_turn(db, conversation_id: UUID, content: str):
+    """
+    Save the user's message to an active conversation.
+    Blocking; the write may wait for an ingestion transaction, so run it in the thread pool.
     
+    Returns:
+        The conversation, the rolling summary of its older turns (or None) and its
+        most recent messages before the new one
+    """
     # Get the conversation
     conversation_response = db.table('conversations').select('*').eq('id', str(conversation_id)).execute()
     
@@ -68,7 +75,7 @@ async def send_message(
     # Create and save the user message
     user_message = {
         "conversation_id": str(conversation_id),
-        "content": message["content"],
+        "content": content,
         "role": "user",
         "timestamp": datetime.utcnow().isoformat()
     }
@@ -91,41 +98,59 @@ async def send_message(
             detail="Tenant not found"
         )
     
-    tenant = tenant_response.data[0]
+    # Get the recent history and the summary of older turns, not the whole conversation
+    conversation_summary, conversation_history = load_history(str(conversation_id), exclude_message_id=user_msg_response.data[0]['id'])
     
-    # Get conversation history
-    history_response = db.table('messages').select('*').eq('conversation_id', str(conversation_id)).execute()
-    conversation_history = history_response.data
+    return conversation, conversation_summary, conversation_history
+
+def _save_assistant_message(db, conversation_id: UUID, content: str):
+    """Save the assistant's answer and bump the conversation's last activity time. Blocking, run it in the thread pool."""
+    assistant_message = {
+        "conversation_id": str(conversation_id),
+        "content": content,
+        "role": "assistant",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    
+    assistant_msg_response = db.table('messages').insert(assistant_message).execute()
+    
+    if not assistant_msg_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to save assistant message"
+        )
+    
+    # Update conversation last activity time; the updated row isn't needed
+    db.table('conversations').update({"updated_at": datetime.utcnow().isoformat()}, returning='minimal').eq('id', str(conversation_id)).execute()
+    
+    return assistant_msg_response.data[0]
+
+@router.post("/message/{conversation_id}", response_model=Message)
+async def send_message(
+    conversation_id: UUID,
+    background_tasks: BackgroundTasks,
+    message: Dict[str, Any] = Body(...),
+):
+    db = get_sqlite_client()
+    conversation, conversation_summary, conversation_history = await run_in_threadpool(_begin_message_turn, db, conversation_id, message["content"])
     
     # Process the message with the AI
     try:
         ai_response = await process_chat_message(
             message["content"],
             conversation_history,
-            tenant_id,
-            conversation["session_id"]
+            conversation["tenant_id"],
+            conversation["session_id"],
+            conversation_summary
         )
         
         # Save the AI response
-        assistant_message = {
-            "conversation_id": str(conversation_id),
-            "content": ai_response,
-            "role": "assistant",
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        assistant_msg_response = db.table('messages').insert(assistant_message).execute()
+        saved_message = await run_in_threadpool(_save_assistant_message, db, conversation_id, ai_response)
         
-        if not assistant_msg_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Failed to save assistant message"
-            )
+        # Fold turns that left the history window into the summary after responding
+        background_tasks.add_task(update_rolling_summary, str(conversation_id))
         
-        # Update conversation last activity time
-        db.table('conversations').update({"updated_at": datetime.utcnow().isoformat()}).eq('id', str(conversation_id)).execute()
-        
-        return assistant_msg_response.data[0]
+        return saved_message
     
     except Exception as e:
         print(f"Error processing message: {e}")
@@ -134,6 +159,55 @@ async def send_message(
             detail=f"Error processing message: {str(e)}"
         )
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/message/{conversation_id}/stream")
+async def send_message_stream(
+    conversation_id: UUID,
+    message: Dict[str, Any] = Body(...),
+):
+    """
+    Streaming variant of send_message, answering with server-sent events.
+    
+    Sends a "token" event ({"content": ...}) for each piece of the answer as the LLM
+    produces it, then a "done" event with the saved assistant message. Failures after
+    the stream has started are reported with an "error" event, and a partial answer
+    is not saved.
+    """
+    db = get_sqlite_client()
+    conversation, conversation_summary, conversation_history = await run_in_threadpool(_begin_message_turn, db, conversation_id, message["content"])
+    
+    async def events():
+        pieces = []
+        try:
+            async for piece in stream_chat_message(
+                message["content"],
+                conversation_history,
+                conversation["tenant_id"],
+                conversation["session_id"],
+                conversation_summary
+            ):
+                pieces.append(piece)
+                yield _sse_event("token", {"content": piece})
+            
+            # Persist the complete answer once the stream has finished
+            saved_message = await run_in_threadpool(_save_assistant_message, db, conversation_id, "".join(pieces))
+            yield _sse_event("done", saved_message)
+        
+        except Exception as e:
+            print(f"Error streaming message: {e}")
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield _sse_event("error", {"detail": f"Error processing message: {detail}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(update_rolling_summary, str(conversation_id))
+    )
+
 @router.get("/conversation/{conversation_id}", response_model=Conversation)
 async def get_conversation(conversation_id: UUID):
     db = get_sqlite_client()
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from uuid import UUID, uuid4
 from datetime import datetime
 import os
 import shutil
-from app.db.sqlite_db import get_sqlite_client
+from app.db.sqlite_db import get_sqlite_client, FileTooLargeError
+from app.core.config import settings
 from app.api.endpoints.auth import get_current_user
 from app.models.document import Document, DocumentCreate, DocumentUpdate
-from app.services.llm import process_document, vector_search_available, embedding_model
+from app.services.llm import process_document, reindex_document, get_embedding_model_status
+from app.services.vector_index import get_index_registry
+from app.services.result_cache import get_retrieval_result_cache
 
 router = APIRouter()
 
@@ -57,20 +61,24 @@ async def upload_document(
         storage_path = f"documents/{tenant_id}/{file.filename}"
         print(f"Saving file to: {storage_path}")
         
-        # Read file content and save to storage
-        file_content = file.file.read()
-        file_size = len(file_content)
-        print(f"Received file: {file.filename}, size: {file_size} bytes")
-        
-        # Create a file-like object from the bytes
-        from io import BytesIO
-        file_like = BytesIO(file_content)
-        
-        # Save the file using the storage adapter
-        db.storage.from_("documents").upload(
-            path=storage_path,
-            file=file_like
-        )
+        # Copy the upload into storage block by block on a worker thread, so large files
+        # are never held in memory and disk writes don't block the event loop
+        try:
+            stored = await run_in_threadpool(
+                db.storage.from_("documents").upload_stream,
+                storage_path,
+                file.file,
+                max_bytes=settings.UPLOAD_MAX_BYTES,
+                block_size=settings.UPLOAD_BLOCK_SIZE
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        finally:
+            await file.close()
+        print(f"Received file: {file.filename}, size: {stored['size']} bytes, sha256: {stored['sha256']}")
         
         # Create document record
         document = DocumentCreate(
@@ -91,11 +99,13 @@ async def upload_document(
             "created_at": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat(),
             "is_processed": 0,  # Using integers for booleans in SQLite
-            "embedding_status": "pending"
+            "embedding_status": "pending",
+            "file_size": stored['size'],
+            "content_hash": stored['sha256']
         }
         
         print(f"Creating document record: {new_document}")
-        response = db.table('documents').insert(new_document).execute()
+        response = await run_in_threadpool(db.table('documents').insert(new_document).execute)
         print(f"Document creation response: {response.data}")
         
         if not response.data:
@@ -217,12 +227,7 @@ async def get_document_status(document_id: UUID, current_user = Depends(get_curr
 @router.get("/vector-search-status", dependencies=[])
 async def get_vector_search_status():
     """Check if vector search is available and working"""
-    status = {
-        "vector_search_available": vector_search_available,
-        "model_loaded": embedding_model is not None,
-        "model_name": embedding_model.__class__.__name__ if embedding_model else None
-    }
-    return status
+    return get_embedding_model_status()
 
 @router.post("/{document_id}/process", status_code=status.HTTP_202_ACCEPTED)
 async def process_document_manually(document_id: UUID, background_tasks: BackgroundTasks, current_user = Depends(get_current_user)):
@@ -260,15 +265,14 @@ async def process_document_manually(document_id: UUID, background_tasks: Backgro
                 detail="Not authorized to access this document"
             )
         
-        # Update document status
-        db.table('documents').update({
-            "is_processed": 0,
+        # Update document status; the current chunks keep serving until the re-index swaps them
+        await run_in_threadpool(db.table('documents').update({
             "embedding_status": "pending"
-        }).eq('id', str(document_id)).execute()
+        }, returning='minimal').eq('id', str(document_id)).execute)
         
-        # Add document processing to background tasks
+        # Re-index in the background, changing only the chunks that differ
         background_tasks.add_task(
-            process_document,
+            reindex_document,
             document_id=str(document_id),
             file_path=document['file_path'],
             document_type=document['document_type'],
@@ -334,14 +338,19 @@ async def delete_document(document_id: UUID, current_user = Depends(get_current_
         
         # First delete any document chunks to avoid foreign key constraint errors
         try:
-            db.table('document_chunks').delete().eq('document_id', str(document_id)).execute()
+            await run_in_threadpool(db.table('document_chunks').delete().eq('document_id', str(document_id)).execute)
             print(f"Deleted document chunks for document {document_id}")
+            
+            # Drop the chunks from the tenant's cached vector index as well; this may copy
+            # a memory-mapped index, so keep it off the event loop
+            await run_in_threadpool(get_index_registry().remove_document, document['tenant_id'], str(document_id))
         except Exception as chunk_error:
             print(f"Error deleting document chunks: {chunk_error}")
             # Continue with document deletion
             
         # Delete the document record
-        db.table('documents').delete().eq('id', str(document_id)).execute()
+        await run_in_threadpool(db.table('documents').delete().eq('id', str(document_id)).execute)
+        get_retrieval_result_cache().bump_version(document['tenant_id'])
         print(f"Document {document_id} deleted successfully")
         
         return None
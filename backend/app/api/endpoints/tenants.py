@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from uuid import UUID, uuid4
 from datetime import datetime
@@ -37,7 +38,7 @@ async def create_tenant(tenant: TenantCreate, current_user = Depends(get_current
         }
         
         print(f"New tenant data: {new_tenant}")
-        response = db.table('tenants').insert(new_tenant).execute()
+        response = await run_in_threadpool(db.table('tenants').insert(new_tenant).execute)
         print(f"Tenant creation response: {response.data}")
         
         if not response.data:
@@ -148,7 +149,7 @@ async def update_tenant(tenant_id: UUID, tenant_update: TenantUpdate, current_us
             
         update_data["updated_at"] = datetime.utcnow().isoformat()
         
-        response = db.table('tenants').update(update_data).eq('id', str(tenant_id)).execute()
+        response = await run_in_threadpool(db.table('tenants').update(update_data).eq('id', str(tenant_id)).execute)
         
         if not response.data:
             raise HTTPException(
@@ -193,7 +194,7 @@ async def delete_tenant(tenant_id: UUID, current_user = Depends(get_current_user
             )
         
         # Delete the tenant
-        db.table('tenants').delete().eq('id', str(tenant_id)).execute()
+        await run_in_threadpool(db.table('tenants').delete().eq('id', str(tenant_id)).execute)
         
         return None
     except HTTPException:
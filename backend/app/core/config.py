@@ -17,9 +17,72 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     
+    # SQLite
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))  # reader connections
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable across app crashes in WAL mode
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "32768"))  # page cache per connection
+    SQLITE_MMAP_SIZE_MB: int = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+    
     # LLM Provider
     MCP_API_KEY: str = os.getenv("MCP_API_KEY", "")
-    
+
+    # Vector search
+    # *_TOKENS budgets are counted with tiktoken; without it they are estimated from the
+    # UTF-8 size at 3 bytes per token, which overcounts rather than overflowing the model
+    VECTOR_INDEX_MEMORY_BUDGET_MB: int = int(os.getenv("VECTOR_INDEX_MEMORY_BUDGET_MB", "512"))
+    VECTOR_INDEX_TYPE: str = os.getenv("VECTOR_INDEX_TYPE", "auto")  # auto, flat, sq8, pq, hnsw, ivf_flat, ivf_pq
+    VECTOR_INDEX_HNSW_THRESHOLD: int = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "10000"))
+    VECTOR_INDEX_IVF_THRESHOLD: int = int(os.getenv("VECTOR_INDEX_IVF_THRESHOLD", "100000"))
+    VECTOR_INDEX_IVF_PQ_THRESHOLD: int = int(os.getenv("VECTOR_INDEX_IVF_PQ_THRESHOLD", "1000000"))
+    VECTOR_INDEX_NPROBE: int = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+    VECTOR_INDEX_EF_SEARCH: int = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+    VECTOR_INDEX_EF_CONSTRUCTION: int = int(os.getenv("VECTOR_INDEX_EF_CONSTRUCTION", "80"))
+    VECTOR_INDEX_HNSW_M: int = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+    VECTOR_INDEX_PQ_M: int = int(os.getenv("VECTOR_INDEX_PQ_M", "48"))  # sub-quantizers, must divide 384
+    VECTOR_INDEX_RERANK_FACTOR: int = int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", "4"))  # candidates per result for sq8/pq
+    EMBEDDING_STORAGE_DTYPE: str = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32 or int8
+    VECTOR_INDEX_PERSIST: bool = os.getenv("VECTOR_INDEX_PERSIST", "true").lower() == "true"
+    VECTOR_INDEX_DIR: str = os.getenv("VECTOR_INDEX_DIR", "data/vector_indexes")
+    VECTOR_INDEX_FRESHNESS_CHECK_SECONDS: float = float(os.getenv("VECTOR_INDEX_FRESHNESS_CHECK_SECONDS", "5"))  # how often a cached index is checked against the database
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+    UPLOAD_BLOCK_SIZE: int = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))  # bytes copied per read
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))  # repeated from the previous chunk
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", "2"))
+    EMBEDDING_QUEUE_SIZE: int = int(os.getenv("EMBEDDING_QUEUE_SIZE", "64"))
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+    QUERY_EMBEDDING_CACHE_PATH: str = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")  # e.g. data/query_embeddings.json
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")  # hybrid, vector or keyword
+    RETRIEVAL_NUM_RESULTS: int = int(os.getenv("RETRIEVAL_NUM_RESULTS", "5"))
+    RETRIEVAL_CANDIDATES: int = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))  # results per leg before fusion
+    RETRIEVAL_VECTOR_WEIGHT: float = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "1.0"))
+    RETRIEVAL_KEYWORD_WEIGHT: float = float(os.getenv("RETRIEVAL_KEYWORD_WEIGHT", "1.0"))
+    RETRIEVAL_RRF_K: int = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+    RETRIEVAL_TIMEOUT_MS: int = int(os.getenv("RETRIEVAL_TIMEOUT_MS", "1500"))  # per leg, slower legs are dropped
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE", "5000"))
+    RETRIEVAL_CACHE_TTL_SECONDS: float = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))  # retrieved context sent to the LLM
+    CONTEXT_DEDUP_SIMILARITY: float = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))  # chunks this similar count as duplicates
+    CONTEXT_CANDIDATE_FACTOR: int = int(os.getenv("CONTEXT_CANDIDATE_FACTOR", "2"))  # candidates retrieved per packed chunk
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "200"))  # per tenant
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+    HISTORY_MAX_MESSAGES: int = int(os.getenv("HISTORY_MAX_MESSAGES", "12"))  # recent messages sent verbatim
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+    SUMMARY_INPUT_TOKEN_LIMIT: int = int(os.getenv("SUMMARY_INPUT_TOKEN_LIMIT", "4000"))
+    SINGLE_FLIGHT_COMPLETIONS: bool = os.getenv("SINGLE_FLIGHT_COMPLETIONS", "true").lower() == "true"  # share identical first-turn completions
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "50"))
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+    LLM_HTTP_READ_TIMEOUT: float = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "60"))
+    LLM_HTTP_WRITE_TIMEOUT: float = float(os.getenv("LLM_HTTP_WRITE_TIMEOUT", "10"))
+    LLM_HTTP_POOL_TIMEOUT: float = float(os.getenv("LLM_HTTP_POOL_TIMEOUT", "5"))
+
     # Google Calendar
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
@@ -1,9 +1,15 @@
 import sqlite3
+import hashlib
 import json
+import queue
+import tempfile
+import threading
 import uuid
 import os
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from app.core.config import settings
 
 # Create a 'data' directory if it doesn't exist
 data_dir = Path('data')
@@ -12,16 +18,39 @@ data_dir.mkdir(exist_ok=True)
 # Database file path
 DB_PATH = 'data/app.db'
 
+# INSERT/UPDATE ... RETURNING needs SQLite 3.35 or newer
+RETURNING_SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Inserted rows read back per SELECT, below SQLite's limit on bound parameters
+READ_BACK_BATCH_SIZE = 500
+
 class SQLiteDB:
-    """SQLite database implementation to replace in-memory database"""
+    """
+    SQLite database implementation to replace in-memory database
+    
+    The database runs in WAL mode with one writer connection (conn) and a small pool
+    of read-only connections. Readers see the last committed state and are not blocked
+    by a write in progress, so chat queries keep running while documents are ingested.
+    Writes are serialized by write_lock (see write_connection). Waiting for the write
+    lock or for a free reader is bounded by SQLITE_BUSY_TIMEOUT_MS, like SQLite's own
+    busy timeout, after which sqlite3.OperationalError is raised.
+    """
     
     def __init__(self):
-        """Initialize database connection and create tables if they don't exist"""
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        # Enable foreign keys
-        self.conn.execute("PRAGMA foreign_keys = ON")
-        # Use Row factory for dictionaries
-        self.conn.row_factory = sqlite3.Row
+        """Initialize database connections and create tables if they don't exist"""
+        self.conn = self._connect()
+        # WAL is a property of the database file, so setting it once on the writer is enough
+        self.journal_mode = self.conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if self.journal_mode.lower() != 'wal':
+            print(f"SQLite WAL mode not available, using {self.journal_mode} journal")
+        self.write_lock = threading.RLock()
+        
+        # Reader connections are opened on first use, up to SQLITE_READ_POOL_SIZE
+        self.read_pool_size = max(1, settings.SQLITE_READ_POOL_SIZE)
+        self._readers = queue.LifoQueue()
+        self._readers_opened = 0
+        self._readers_lock = threading.Lock()
+        self._readers_available = threading.Semaphore(self.read_pool_size)
         
         # Create tables
         self._create_tables()
@@ -29,6 +58,84 @@ class SQLiteDB:
         # Initialize auth system
         self.auth = self.Auth(self)
         self.storage = self.Storage(self)
+    
+    def _connect(self, read_only=False):
+        """Open a connection with the app's pragmas"""
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        # Use Row factory for dictionaries
+        conn.row_factory = sqlite3.Row
+        # Enable foreign keys
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        # A negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size = -{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    @contextmanager
+    def read_connection(self):
+        """
+        Borrow a read-only connection from the pool, waiting up to SQLITE_BUSY_TIMEOUT_MS
+        if all are in use.
+        
+        Usage:
+            with db.read_connection() as conn:
+                rows = conn.execute(...).fetchall()
+        """
+        if not self._readers_available.acquire(timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000):
+            raise sqlite3.OperationalError("no reader connection available, all are in use")
+        try:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                with self._readers_lock:
+                    self._readers_opened += 1
+                conn = self._connect(read_only=True)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._readers.put(conn)
+        finally:
+            self._readers_available.release()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Run several writes on the writer connection as one transaction, committed
+        when the block exits and rolled back if it raises.
+        
+        Usage:
+            with db.transaction() as conn:
+                conn.executemany(...)
+        """
+        with self.write_connection() as conn:
+            with conn:
+                yield conn
+    
+    @contextmanager
+    def write_connection(self):
+        """Hold the write lock, waiting up to SQLITE_BUSY_TIMEOUT_MS, and yield the writer connection"""
+        if not self.write_lock.acquire(timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000):
+            raise sqlite3.OperationalError("database is locked by another write")
+        try:
+            yield self.conn
+        finally:
+            self.write_lock.release()
+    
+    def pool_stats(self):
+        """Return connection pool usage for monitoring"""
+        return {
+            "journal_mode": self.journal_mode,
+            "read_pool_size": self.read_pool_size,
+            "readers_opened": self._readers_opened,
+            "readers_idle": self._readers.qsize(),
+        }
         
     def _create_tables(self):
         """Create necessary database tables if they don't exist"""
@@ -88,6 +195,8 @@ class SQLiteDB:
             tenant_id TEXT NOT NULL,
             is_processed INTEGER DEFAULT 0,
             embedding_status TEXT DEFAULT 'pending',
+            file_size INTEGER,
+            content_hash TEXT,
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
             FOREIGN KEY (tenant_id) REFERENCES tenants (id)
@@ -102,11 +211,24 @@ class SQLiteDB:
             tenant_id TEXT NOT NULL,
             content TEXT NOT NULL,
             chunk_index INTEGER NOT NULL,
-            embedding TEXT,
+            embedding BLOB,
+            content_hash TEXT,
             created_at TEXT NOT NULL,
             FOREIGN KEY (document_id) REFERENCES documents (id)
         )
         ''')
+        
+        # Columns added after the first release; CREATE TABLE IF NOT EXISTS leaves older databases without them
+        self._add_missing_columns(cursor, 'documents', {'file_size': 'INTEGER', 'content_hash': 'TEXT'})
+        self._add_missing_columns(cursor, 'document_chunks', {'content_hash': 'TEXT'})
+        
+        # Ingestion looks up stored embeddings by the content hash of each new chunk
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_document_chunks_tenant_content_hash ON document_chunks (tenant_id, content_hash)
+        ''')
+
+        # Full-text index over chunk content for keyword retrieval
+        self.fts_available = self._create_chunk_fts(cursor)
 
         # Create a directory for document storage
         os.makedirs('data/documents', exist_ok=True)
@@ -137,8 +259,91 @@ class SQLiteDB:
         )
         ''')
         
+        # Recent-history queries read a conversation's messages by time
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp ON messages (conversation_id, timestamp)
+        ''')
+        
+        # Create conversation summaries table (rolling summary of turns older than the history window)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            id TEXT PRIMARY KEY,
+            conversation_id TEXT UNIQUE NOT NULL,
+            summary TEXT NOT NULL,
+            summarized_until TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        ''')
+        
         self.conn.commit()
+
+    def _add_missing_columns(self, cursor, table_name, columns):
+        """Add columns that an existing table was created without"""
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, column_type in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}")
+                print(f"Added column {name} to {table_name}")
     
+    def _create_chunk_fts(self, cursor):
+        """
+        Create the FTS5 index over document_chunks and the triggers that keep it in sync.
+        The index is external-content: it stores only the inverted index and reads chunk
+        text from document_chunks by rowid, so content is not duplicated on disk.
+        tenant_id is indexed so a MATCH can be restricted to one tenant's chunks.
+
+        Returns:
+            True if FTS5 is available, False if keyword search must fall back to scanning
+        """
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'document_chunks_fts'")
+        row = cursor.fetchone()
+        exists = row is not None
+        if exists and 'UNINDEXED' in row[0]:
+            # Created by an older release that could not filter by tenant inside MATCH
+            cursor.execute("DROP TABLE document_chunks_fts")
+            exists = False
+
+        try:
+            cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS document_chunks_fts USING fts5(
+                content,
+                tenant_id,
+                content='document_chunks',
+                content_rowid='rowid',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"FTS5 not available, keyword search will scan chunks: {e}")
+            return False
+
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS document_chunks_fts_insert AFTER INSERT ON document_chunks BEGIN
+            INSERT INTO document_chunks_fts (rowid, content, tenant_id) VALUES (new.rowid, new.content, new.tenant_id);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS document_chunks_fts_delete AFTER DELETE ON document_chunks BEGIN
+            INSERT INTO document_chunks_fts (document_chunks_fts, rowid, content, tenant_id) VALUES ('delete', old.rowid, old.content, old.tenant_id);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS document_chunks_fts_update AFTER UPDATE OF content, tenant_id ON document_chunks BEGIN
+            INSERT INTO document_chunks_fts (document_chunks_fts, rowid, content, tenant_id) VALUES ('delete', old.rowid, old.content, old.tenant_id);
+            INSERT INTO document_chunks_fts (rowid, content, tenant_id) VALUES (new.rowid, new.content, new.tenant_id);
+        END
+        ''')
+
+        if not exists:
+            # Index the chunks stored before the FTS table existed
+            cursor.execute("INSERT INTO document_chunks_fts (document_chunks_fts) VALUES ('rebuild')")
+            print("Built full-text index for existing document chunks")
+
+        return True
+
     def table(self, table_name):
         """Get a query builder for a specific table"""
         return TableQueryBuilder(self, table_name)
@@ -153,12 +358,11 @@ class SQLiteDB:
             user_id = str(uuid.uuid4())
             now = datetime.utcnow().isoformat()
             
-            cursor = self.db.conn.cursor()
-            cursor.execute(
-                "INSERT INTO auth_users (id, email, password, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (user_id, email, password, now, now)
-            )
-            self.db.conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO auth_users (id, email, password, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (user_id, email, password, now, now)
+                )
             
             # Return auth response object
             user = {
@@ -172,12 +376,11 @@ class SQLiteDB:
         
         def sign_in(self, email, password):
             """Sign in existing user"""
-            cursor = self.db.conn.cursor()
-            cursor.execute(
-                "SELECT * FROM auth_users WHERE email = ? AND password = ?",
-                (email, password)
-            )
-            row = cursor.fetchone()
+            with self.db.read_connection() as conn:
+                row = conn.execute(
+                    "SELECT * FROM auth_users WHERE email = ? AND password = ?",
+                    (email, password)
+                ).fetchone()
             
             if row:
                 user = dict(row)
@@ -196,7 +399,12 @@ class SQLiteDB:
             return StorageBucket(self, bucket)
         
     def close(self):
-        """Close database connection"""
+        """Close database connections"""
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
         if self.conn:
             self.conn.close()
 
@@ -213,6 +421,12 @@ class AuthResponse:
     def __repr__(self):
         return self.__str__()
 
+class FileTooLargeError(Exception):
+    """Raised when an uploaded file exceeds the maximum upload size"""
+    def __init__(self, max_bytes):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
 class StorageBucket:
     """Storage bucket operations"""
     def __init__(self, storage, bucket_name):
@@ -250,6 +464,52 @@ class StorageBucket:
         
         return {"path": path}
     
+    def upload_stream(self, path, source, max_bytes=None, block_size=1024 * 1024):
+        """
+        Save a file-like object to storage, copying it in fixed-size blocks.
+        
+        The data is written to a temporary file next to the destination and renamed into
+        place once complete, so readers never see a partial file. The SHA-256 and size
+        are computed while copying.
+        
+        Args:
+            path: Destination path within the bucket
+            source: Binary file-like object to read from
+            max_bytes: Maximum accepted size; FileTooLargeError is raised beyond it
+            block_size: Number of bytes copied per read
+            
+        Returns:
+            Dictionary with the path, size in bytes and hex SHA-256 of the file
+        """
+        full_path = self.base_path / path
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    block = source.read(block_size)
+                    if not block:
+                        break
+                    size += len(block)
+                    if max_bytes is not None and size > max_bytes:
+                        raise FileTooLargeError(max_bytes)
+                    sha256.update(block)
+                    f.write(block)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, full_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        return {"path": path, "size": size, "sha256": sha256.hexdigest()}
+    
     def download(self, path):
         """Download file content"""
         full_path = self.base_path / path
@@ -259,6 +519,10 @@ class StorageBucket:
         except FileNotFoundError:
             return b'File not found'
     
+    def open(self, path):
+        """Open a stored file for reading in binary mode, without loading it into memory"""
+        return open(self.base_path / path, 'rb')
+    
     def remove(self, paths):
         """Remove files"""
         for path in paths:
@@ -276,8 +540,12 @@ class TableQueryBuilder:
         self.select_fields = '*'
         self.where_clauses = []
         self.where_values = []
+        self.order_clauses = []
+        self.limit_count = None
         self.insert_data = None
         self.update_data = None
+        self.returning = 'representation'
+        self.count_method = None
         self.delete_flag = False
     
     def select(self, fields):
@@ -291,14 +559,54 @@ class TableQueryBuilder:
         self.where_values.append(value)
         return self
     
-    def insert(self, data):
-        """Set data to insert"""
+    def gt(self, field, value):
+        """Add greater-than condition"""
+        self.where_clauses.append(f"{field} > ?")
+        self.where_values.append(value)
+        return self
+    
+    def lt(self, field, value):
+        """Add less-than condition"""
+        self.where_clauses.append(f"{field} < ?")
+        self.where_values.append(value)
+        return self
+    
+    def order(self, field, desc=False):
+        """Order selected rows by a field"""
+        self.order_clauses.append(f"{field} {'DESC' if desc else 'ASC'}")
+        return self
+    
+    def limit(self, count):
+        """Limit the number of selected rows"""
+        self.limit_count = int(count)
+        return self
+    
+    def insert(self, data, returning='representation', count=None):
+        """
+        Set data to insert
+        
+        Args:
+            data: A row dictionary, or a list of them to insert in one transaction
+            returning: "representation" to read the inserted rows back, "minimal" to skip it
+            count: "exact" to report the number of inserted rows in the response's count
+        """
         self.insert_data = data
+        self.returning = returning
+        self.count_method = count
         return self
     
-    def update(self, data):
-        """Set data to update"""
+    def update(self, data, returning='representation', count=None):
+        """
+        Set data to update
+        
+        Args:
+            data: Column values to set
+            returning: "representation" to return the updated rows, "minimal" to skip it
+            count: "exact" to report the number of updated rows in the response's count
+        """
         self.update_data = data
+        self.returning = returning
+        self.count_method = count
         return self
     
     def delete(self):
@@ -308,45 +616,84 @@ class TableQueryBuilder:
     
     def execute(self):
         """Execute the query"""
-        cursor = self.db.conn.cursor()
+        if self.insert_data is not None and len(self.insert_data) == 0:
+            # Nothing to insert; without this the query would run as a select of the whole table
+            return QueryResponse([], 0)
+            
+        is_write = self.insert_data is not None or bool(self.where_clauses and (self.update_data or self.delete_flag))
+        if is_write:
+            # Writes are serialized on the writer connection
+            with self.db.write_connection() as conn:
+                return self._execute(conn)
+        
+        # Reads use a pooled read-only connection and don't wait for writes
+        with self.db.read_connection() as conn:
+            return self._execute(conn)
+    
+    def _execute(self, conn):
+        """Execute the query on a connection"""
+        cursor = conn.cursor()
         
         try:
             # Insert operation
             if self.insert_data:
-                # Add ID if not present
-                if 'id' not in self.insert_data:
-                    self.insert_data['id'] = str(uuid.uuid4())
+                rows = self.insert_data if isinstance(self.insert_data, list) else [self.insert_data]
                 
-                # Handle JSON fields
-                for key, value in self.insert_data.items():
-                    if isinstance(value, dict):
-                        self.insert_data[key] = json.dumps(value)
+                # Rows with the same columns share one statement, executed with executemany
+                statements = {}
+                for data in rows:
+                    # Add ID if not present
+                    if 'id' not in data:
+                        data['id'] = str(uuid.uuid4())
+                    
+                    # Handle JSON fields
+                    for key, value in data.items():
+                        if isinstance(value, dict):
+                            data[key] = json.dumps(value)
+                    
+                    statements.setdefault(tuple(data.keys()), []).append(list(data.values()))
                 
-                # Build query
-                columns = ', '.join(self.insert_data.keys())
-                placeholders = ', '.join(['?'] * len(self.insert_data))
-                query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+                read_back = self.returning != 'minimal'
                 
-                cursor.execute(query, list(self.insert_data.values()))
-                self.db.conn.commit()
+                # A single row is inserted and returned by one statement where RETURNING is supported
+                if read_back and len(rows) == 1 and RETURNING_SUPPORTED:
+                    columns = ', '.join(rows[0].keys())
+                    placeholders = ', '.join(['?'] * len(rows[0]))
+                    query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders}) RETURNING *"
+                    cursor.execute(query, list(rows[0].values()))
+                    result = _format_rows(cursor.fetchall())
+                    conn.commit()
+                    return QueryResponse(result, len(result) if self.count_method else None)
                 
-                # Get the inserted data
-                query = f"SELECT * FROM {self.table_name} WHERE id = ?"
-                cursor.execute(query, (self.insert_data['id'],))
+                # All rows are written in a single transaction
+                inserted = 0
+                for keys, values in statements.items():
+                    columns = ', '.join(keys)
+                    placeholders = ', '.join(['?'] * len(keys))
+                    query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+                    cursor.executemany(query, values)
+                    inserted += len(values)
+                conn.commit()
                 
-                # Format the result
-                result = [dict(row) for row in cursor.fetchall()]
+                count = inserted if self.count_method else None
+                if not read_back:
+                    return QueryResponse([], count)
+                
+                # Get the inserted data, in the order it was given
+                ids = [data['id'] for data in rows]
+                by_id = {}
+                for offset in range(0, len(ids), READ_BACK_BATCH_SIZE):
+                    batch = ids[offset:offset + READ_BACK_BATCH_SIZE]
+                    query = f"SELECT * FROM {self.table_name} WHERE id IN ({', '.join(['?'] * len(batch))})"
+                    cursor.execute(query, batch)
+                    
+                    for row in cursor.fetchall():
+                        by_id[row['id']] = row
                 
-                # Parse JSON fields
-                for row in result:
-                    for key, value in row.items():
-                        if key == 'chat_widget_config' and isinstance(value, str):
-                            try:
-                                row[key] = json.loads(value)
-                            except:
-                                pass
+                # Format the result
+                result = _format_rows(by_id[row_id] for row_id in ids if row_id in by_id)
                 
-                return QueryResponse(result)
+                return QueryResponse(result, count)
             
             # Update operation
             elif self.update_data and self.where_clauses:
@@ -360,28 +707,29 @@ class TableQueryBuilder:
                 where_clause = ' AND '.join(self.where_clauses)
                 query = f"UPDATE {self.table_name} SET {set_clause} WHERE {where_clause}"
                 
-                # Execute
                 values = list(self.update_data.values()) + self.where_values
-                cursor.execute(query, values)
-                self.db.conn.commit()
                 
-                # Get the updated data
-                select_query = f"SELECT * FROM {self.table_name} WHERE {where_clause}"
-                cursor.execute(select_query, self.where_values)
+                if self.returning == 'minimal':
+                    cursor.execute(query, values)
+                    count = cursor.rowcount if self.count_method else None
+                    conn.commit()
+                    return QueryResponse([], count)
                 
-                # Format the result
-                result = [dict(row) for row in cursor.fetchall()]
-                
-                # Parse JSON fields
-                for row in result:
-                    for key, value in row.items():
-                        if key == 'chat_widget_config' and isinstance(value, str):
-                            try:
-                                row[key] = json.loads(value)
-                            except:
-                                pass
+                if RETURNING_SUPPORTED:
+                    # Update and return the rows with one statement
+                    cursor.execute(query + " RETURNING *", values)
+                    result = _format_rows(cursor.fetchall())
+                    conn.commit()
+                else:
+                    cursor.execute(query, values)
+                    conn.commit()
+                    
+                    # Get the updated data
+                    select_query = f"SELECT * FROM {self.table_name} WHERE {where_clause}"
+                    cursor.execute(select_query, self.where_values)
+                    result = _format_rows(cursor.fetchall())
                 
-                return QueryResponse(result)
+                return QueryResponse(result, len(result) if self.count_method else None)
             
             # Delete operation
             elif self.delete_flag and self.where_clauses:
@@ -389,7 +737,7 @@ class TableQueryBuilder:
                 query = f"DELETE FROM {self.table_name} WHERE {where_clause}"
                 
                 cursor.execute(query, self.where_values)
-                self.db.conn.commit()
+                conn.commit()
                 
                 return QueryResponse([])
             
@@ -400,35 +748,40 @@ class TableQueryBuilder:
                     where_clause = 'WHERE ' + ' AND '.join(self.where_clauses)
                 
                 query = f"SELECT {self.select_fields} FROM {self.table_name} {where_clause}"
+                if self.order_clauses:
+                    query += ' ORDER BY ' + ', '.join(self.order_clauses)
+                if self.limit_count is not None:
+                    query += f" LIMIT {self.limit_count}"
                 
                 cursor.execute(query, self.where_values)
                 
-                # Format the result
-                result = [dict(row) for row in cursor.fetchall()]
-                
-                # Parse JSON fields
-                for row in result:
-                    for key, value in row.items():
-                        if key == 'chat_widget_config' and isinstance(value, str):
-                            try:
-                                row[key] = json.loads(value)
-                            except:
-                                pass
-                
-                return QueryResponse(result)
+                return QueryResponse(_format_rows(cursor.fetchall()))
                 
         except Exception as e:
             print(f"SQL Error: {e}")
-            self.db.conn.rollback()
+            conn.rollback()
             raise e
 
+def _format_rows(rows):
+    """Convert result rows to dictionaries, parsing JSON fields"""
+    result = [dict(row) for row in rows]
+    for row in result:
+        value = row.get('chat_widget_config')
+        if isinstance(value, str):
+            try:
+                row['chat_widget_config'] = json.loads(value)
+            except:
+                pass
+    return result
+
 class QueryResponse:
     """Query response object to match Supabase interface"""
-    def __init__(self, data):
+    def __init__(self, data, count=None):
         self.data = data
+        self.count = count
     
     def __str__(self):
-        return f"QueryResponse(data={self.data})"
+        return f"QueryResponse(data={self.data}, count={self.count})"
     
     def __repr__(self):
         return self.__str__()
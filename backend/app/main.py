@@ -1,8 +1,20 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api.api import api_router
 from app.core.config import settings
-from app.services.llm import vector_search_available, embedding_model
+from app.db.sqlite_db import get_sqlite_client
+from app.services.llm import embedding_stats, get_embedding_model_status, start_embedding_model_loader
+from app.services.vector_index import get_index_registry
+from app.services.embedding_executor import get_embedding_executor
+from app.services.query_cache import get_query_embedding_cache
+from app.services.result_cache import get_retrieval_result_cache
+from app.services.response_cache import get_semantic_response_cache
+from app.services.http_client import get_llm_http_client
+from app.services.singleflight import get_retrieval_flights, get_completion_flights
 
 app = FastAPI(
     title="AI Chat Agent Platform",
@@ -23,6 +35,25 @@ app.add_middleware(
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Seconds from importing the app to the end of the startup event, reported by /vector-status
+startup_seconds = None
+
+@app.on_event("startup")
+async def startup_event():
+    global startup_seconds
+    get_query_embedding_cache().load()
+    get_llm_http_client().start()
+    # The model loads in the background; until it is ready chats use keyword retrieval
+    start_embedding_model_loader()
+    startup_seconds = time.perf_counter() - _import_started
+    print(f"Application startup completed in {startup_seconds:.2f}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    get_embedding_executor().shutdown()
+    get_query_embedding_cache().save()
+    await get_llm_http_client().close()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the AI Chat Agent Platform API"}
@@ -31,12 +62,33 @@ async def root():
 async def vector_status():
     """Check if vector search is available and working"""
     status = {
-        "vector_search_available": vector_search_available,
-        "model_loaded": embedding_model is not None,
-        "model_name": embedding_model.__class__.__name__ if embedding_model else None
+        **get_embedding_model_status(),
+        "startup_seconds": startup_seconds,
+        "index_cache": get_index_registry().stats(),
+        "embedding_throughput": embedding_stats,
+        "embedding_executor": get_embedding_executor().stats(),
+        "query_embedding_cache": get_query_embedding_cache().stats(),
+        "retrieval_result_cache": get_retrieval_result_cache().stats(),
+        "semantic_response_cache": get_semantic_response_cache().stats(),
+        "llm_http_client": get_llm_http_client().stats(),
+        "sqlite_connections": get_sqlite_client().pool_stats(),
+        "single_flight": {
+            "retrieval": get_retrieval_flights().stats(),
+            "completion": get_completion_flights().stats()
+        }
     }
     return status
 
+@app.get("/vector-status/ready")
+async def vector_ready():
+    """
+    Readiness probe: 503 while the embedding model is still loading, 200 once it has loaded
+    (or failed to, in which case the app keeps serving keyword retrieval)
+    """
+    model_status = get_embedding_model_status()
+    status_code = 503 if model_status["model_state"] in ("not_loaded", "loading") else 200
+    return JSONResponse(status_code=status_code, content=model_status)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
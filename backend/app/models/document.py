@@ -23,6 +23,8 @@ class DocumentInDB(DocumentBase):
     updated_at: datetime
     is_processed: bool = False
     embedding_status: str = "pending"  # pending, processing, completed, failed
+    file_size: Optional[int] = None  # bytes
+    content_hash: Optional[str] = None  # SHA-256 of the file
 
 class Document(DocumentInDB):
     pass
\ No newline at end of file
@@ -0,0 +1,173 @@
+import codecs
+import re
+import zlib
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+from app.services.tokens import count_tokens
+
+# Bytes read from a document per step
+READ_BLOCK_SIZE = 64 * 1024
+# Sentence ends: terminal punctuation followed by whitespace, or a blank line (headings, list items)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+# Once a chunk is half full, about one sentence in this many ends it early (see chunk_sentences)
+CONTENT_BOUNDARY_MODULUS = 4
+# Text without any sentence boundary is cut at whitespace once the buffer grows past this
+MAX_SENTENCE_CHARS = 8 * 1024
+
+def iter_text(file: BinaryIO, encoding: str = 'utf-8', block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """
+    Read a binary file as text, one block at a time.
+    Undecodable bytes are dropped; multi-byte characters split across blocks are kept intact.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def iter_sentences(blocks: Iterable[str]) -> Iterator[str]:
+    """
+    Split a stream of text blocks into sentences with whitespace collapsed.
+    Only the current unfinished sentence is held in memory.
+    """
+    buffer = ''
+    for block in blocks:
+        buffer += block
+        parts = SENTENCE_BOUNDARY.split(buffer)
+        # The last part may continue in the next block
+        buffer = parts.pop()
+        for part in parts:
+            sentence = ' '.join(part.split())
+            if sentence:
+                yield sentence
+
+        # Text with no sentence boundary at all, e.g. a table dump: cut it at the last whitespace
+        while len(buffer) > MAX_SENTENCE_CHARS:
+            cut = buffer.rfind(' ', 0, MAX_SENTENCE_CHARS)
+            if cut <= 0:
+                cut = MAX_SENTENCE_CHARS
+            sentence = ' '.join(buffer[:cut].split())
+            buffer = buffer[cut:]
+            if sentence:
+                yield sentence
+
+    sentence = ' '.join(buffer.split())
+    if sentence:
+        yield sentence
+
+def _split_long_word(word: str, max_tokens: int) -> List[str]:
+    """
+    Hard-split text without any whitespace, such as a base64 run or minified code,
+    into the longest character prefixes that fit in max_tokens
+    """
+    pieces = []
+    while word:
+        # Binary search for the longest prefix that fits; at least one character per piece
+        low, high = 1, len(word)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(word[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        pieces.append(word[:low])
+        word = word[low:]
+    return pieces
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> List[str]:
+    """Split a sentence longer than max_tokens into word-aligned pieces, cutting words that don't fit on their own"""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for word in sentence.split(' '):
+        word_tokens = count_tokens(' ' + word)
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(' '.join(current))
+            current = []
+            current_tokens = 0
+        if word_tokens > max_tokens:
+            pieces.extend(_split_long_word(word, max_tokens))
+            continue
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def _is_content_boundary(sentence: str) -> bool:
+    """Whether a sentence's text selects it as a chunk boundary, for about 1 in CONTENT_BOUNDARY_MODULUS sentences"""
+    return zlib.crc32(sentence.encode('utf-8')) % CONTENT_BOUNDARY_MODULUS == 0
+
+def _overlap(current: List[Tuple[str, int]], overlap_tokens: int) -> List[Tuple[str, int]]:
+    """The trailing sentences of a chunk that fit in overlap_tokens"""
+    carried = []
+    carried_tokens = 0
+    for text, tokens in reversed(current):
+        if carried_tokens + tokens > overlap_tokens:
+            break
+        carried.insert(0, (text, tokens))
+        carried_tokens += tokens
+    return carried
+
+def chunk_sentences(sentences: Iterable[str], max_tokens: int, overlap_tokens: int = 0) -> Iterator[str]:
+    """
+    Group sentences into chunks of at most max_tokens tokens.
+
+    Once a chunk is half full it also ends after any sentence whose text selects it as a
+    boundary. Boundaries then depend on the nearby text rather than on everything before
+    it, so editing part of a document only changes the chunks around the edit and the
+    rest can be matched to the chunks of the previous version.
+
+    Each chunk after the first starts with the last sentences of the previous chunk,
+    up to overlap_tokens, so text near a chunk boundary is retrievable with its context.
+
+    Args:
+        sentences: Sentences in document order
+        max_tokens: Maximum chunk size in tokens
+        overlap_tokens: Maximum number of tokens repeated from the previous chunk
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    current = []  # (sentence, tokens) pairs
+    carried = 0  # Leading entries of current repeated from the previous chunk
+
+    for sentence in sentences:
+        sentence_tokens = count_tokens(sentence) + 1
+        pieces = [(sentence, sentence_tokens)] if sentence_tokens <= max_tokens else \
+            [(piece, count_tokens(piece) + 1) for piece in _split_long_sentence(sentence, max_tokens - 1)]
+
+        for piece, piece_tokens in pieces:
+            if sum(tokens for _, tokens in current) + piece_tokens > max_tokens:
+                if len(current) > carried:
+                    yield ' '.join(text for text, _ in current)
+                    current = _overlap(current, overlap_tokens)
+                # Drop repeated sentences that leave no room for the new one
+                while current and sum(tokens for _, tokens in current) + piece_tokens > max_tokens:
+                    current.pop(0)
+                carried = len(current)
+
+            current.append((piece, piece_tokens))
+
+            if sum(tokens for _, tokens in current) >= max_tokens // 2 and _is_content_boundary(piece):
+                yield ' '.join(text for text, _ in current)
+                current = _overlap(current, overlap_tokens)
+                carried = len(current)
+
+    if len(current) > carried:
+        yield ' '.join(text for text, _ in current)
+
+def iter_chunks(file: BinaryIO, max_tokens: int, overlap_tokens: int = 0) -> Iterator[str]:
+    """
+    Stream sentence-aligned chunks out of a document file.
+    Memory use depends on the chunk size, not on the size of the file.
+
+    Args:
+        file: Binary file object opened for reading
+        max_tokens: Maximum chunk size in tokens
+        overlap_tokens: Maximum number of tokens repeated from the previous chunk
+    """
+    return chunk_sentences(iter_sentences(iter_text(file)), max_tokens, overlap_tokens)
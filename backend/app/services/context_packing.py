@@ -0,0 +1,96 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.tokens import count_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Sentence ends: terminal punctuation followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+# Don't bother adding a trimmed chunk with less room than this
+MIN_TRIMMED_TOKENS = 40
+
+def content_fingerprint(text: str) -> str:
+    """Hash of a chunk's text ignoring case and whitespace, for exact-duplicate detection"""
+    normalized = re.sub(r'\s+', ' ', text).strip().lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def trim_to_sentences(text: str, max_tokens: int) -> str:
+    """Keep the leading whole sentences of a text that fit in max_tokens"""
+    kept = []
+    used = 0
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        tokens = count_tokens(sentence) + 1
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return ' '.join(kept)
+
+def pack_context(
+    scored_chunks: List[Tuple[Dict[str, Any], Any]],
+    token_budget: int,
+    max_chunks: int,
+    vectors: Optional[Dict[str, Any]] = None,
+    similarity_threshold: float = 0.95
+) -> List[str]:
+    """
+    Select chunk texts for the prompt, best first, within a token budget.
+
+    Chunks whose text is identical to an already selected one, or whose vector is
+    within the similarity threshold of one (e.g. the same document uploaded twice),
+    are skipped. A chunk that does not fit in the remaining budget is cut down to
+    its leading whole sentences.
+
+    Args:
+        scored_chunks: (chunk, score) tuples, ordered best first
+        token_budget: Maximum number of context tokens
+        max_chunks: Maximum number of chunks to select
+        vectors: Optional chunk ID to embedding mapping used for near-duplicate detection
+        similarity_threshold: Cosine similarity above which two chunks count as duplicates
+
+    Returns:
+        List of chunk texts
+    """
+    selected = []
+    fingerprints = set()
+    selected_vectors = []
+    remaining = token_budget
+
+    for chunk, _ in scored_chunks:
+        if len(selected) >= max_chunks or remaining < MIN_TRIMMED_TOKENS:
+            break
+
+        text = chunk['content']
+        fingerprint = content_fingerprint(text)
+        if fingerprint in fingerprints:
+            continue
+
+        vector = _unit_vector(vectors.get(chunk['id'])) if vectors else None
+        if vector is not None and any(float(np.dot(vector, other)) >= similarity_threshold for other in selected_vectors):
+            continue
+
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            text = trim_to_sentences(text, remaining)
+            if count_tokens(text) < MIN_TRIMMED_TOKENS:
+                continue
+            tokens = count_tokens(text)
+
+        selected.append(text)
+        fingerprints.add(fingerprint)
+        if vector is not None:
+            selected_vectors.append(vector)
+        remaining -= tokens
+
+    return selected
+
+def _unit_vector(vector):
+    if vector is None or np is None or len(vector) == 0:
+        return None
+    vector = np.asarray(vector, dtype='float32')
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.db.sqlite_db import get_sqlite_client
+from app.services.singleflight import SingleFlight
+from app.services.tokens import count_tokens, truncate_to_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# Concurrent summary updates of the same conversation share one run
+summary_flights = SingleFlight("summary")
+
+def load_recent_messages(conversation_id: str, limit: int, exclude_message_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Load the most recent messages of a conversation, oldest first.
+
+    Args:
+        limit: Maximum number of messages to load
+        exclude_message_id: Message to leave out, e.g. the one being answered
+    """
+    db = get_sqlite_client()
+    fetch = limit + 1 if exclude_message_id else limit
+    response = db.table('messages').select('id, role, content, timestamp') \
+        .eq('conversation_id', conversation_id) \
+        .order('timestamp', desc=True).limit(fetch).execute()
+
+    messages = [message for message in response.data if message['id'] != exclude_message_id][:limit]
+    messages.reverse()
+    return messages
+
+def get_conversation_summary(conversation_id: str) -> Optional[Dict[str, Any]]:
+    """Get the stored rolling summary of a conversation, if any"""
+    db = get_sqlite_client()
+    response = db.table('conversation_summaries').select('*').eq('conversation_id', conversation_id).execute()
+    return response.data[0] if response.data else None
+
+def load_history(conversation_id: str, exclude_message_id: Optional[str] = None) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Load what the LLM should see of a conversation: the rolling summary of older
+    turns plus the most recent messages, newer than what the summary covers.
+
+    Returns:
+        (summary text or None, recent messages oldest first)
+    """
+    summary = get_conversation_summary(conversation_id)
+    messages = load_recent_messages(conversation_id, settings.HISTORY_MAX_MESSAGES, exclude_message_id)
+    if summary is None:
+        return None, messages
+    return summary['summary'], [message for message in messages if message['timestamp'] > summary['summarized_until']]
+
+def fit_history_to_budget(messages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Keep the newest messages whose combined size fits in the token budget"""
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        used += count_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+        if used > token_budget:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+async def update_rolling_summary(conversation_id: str):
+    """
+    Fold messages that have left the recent-history window into the conversation's summary.
+    The window is the one the next prompt is built from, the newest messages that fit in
+    HISTORY_TOKEN_BUDGET, so every message is either sent verbatim or summarized.
+    Only messages not yet covered by the stored summary are summarized, so each
+    message is processed once rather than on every turn.
+    """
+    try:
+        await summary_flights.do(conversation_id, lambda: _update_rolling_summary(conversation_id))
+    except Exception as e:
+        print(f"Error updating conversation summary for {conversation_id}: {e}")
+
+async def _update_rolling_summary(conversation_id: str):
+    db = get_sqlite_client()
+    recent = load_recent_messages(conversation_id, settings.HISTORY_MAX_MESSAGES)
+    window = fit_history_to_budget(recent, settings.HISTORY_TOKEN_BUDGET)
+    if len(recent) < settings.HISTORY_MAX_MESSAGES and len(window) == len(recent):
+        # The whole conversation still fits in the window
+        return
+
+    summary = get_conversation_summary(conversation_id)
+    query = db.table('messages').select('id, role, content, timestamp') \
+        .eq('conversation_id', conversation_id)
+    if window:
+        query = query.lt('timestamp', window[0]['timestamp'])
+    if summary is not None:
+        query = query.gt('timestamp', summary['summarized_until'])
+    pending = query.order('timestamp').execute().data
+    if not pending:
+        return
+
+    # Fold the pending messages in order, as many per summarization request as fit
+    new_summary = summary['summary'] if summary else ""
+    start = 0
+    while start < len(pending):
+        budget = settings.SUMMARY_INPUT_TOKEN_LIMIT - count_tokens(new_summary)
+        end = start
+        while end < len(pending):
+            budget -= count_tokens(pending[end]['content']) + MESSAGE_OVERHEAD_TOKENS
+            if budget < 0 and end > start:
+                break
+            end += 1
+        new_summary = await _summarize(new_summary, pending[start:end])
+        start = end
+    now = datetime.utcnow().isoformat()
+
+    if summary is None:
+        await run_in_threadpool(db.table('conversation_summaries').insert({
+            "conversation_id": conversation_id,
+            "summary": new_summary,
+            "summarized_until": pending[-1]['timestamp'],
+            "message_count": len(pending),
+            "updated_at": now
+        }, returning='minimal').execute)
+    else:
+        await run_in_threadpool(db.table('conversation_summaries').update({
+            "summary": new_summary,
+            "summarized_until": pending[-1]['timestamp'],
+            "message_count": summary['message_count'] + len(pending),
+            "updated_at": now
+        }, returning='minimal').eq('conversation_id', conversation_id).execute)
+
+    print(f"Folded {len(pending)} messages into the summary of conversation {conversation_id}")
+
+async def _summarize(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Extend a summary with new messages, using the LLM when it is configured"""
+    # Imported here to avoid a circular import, llm imports this module
+    from app.services.llm import _llm_api_key_configured, _request_completion
+
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+    if _llm_api_key_configured():
+        prompt = [
+            {
+                "role": "system",
+                "content": "You maintain a concise running summary of a customer support conversation. "
+                           "Update the summary with the new messages. Keep names, preferences, open questions "
+                           "and commitments; drop greetings and small talk. Reply with the summary only."
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+            }
+        ]
+        try:
+            summary = await _request_completion(prompt, max_tokens=settings.SUMMARY_MAX_TOKENS)
+            return truncate_to_tokens(summary.strip(), settings.SUMMARY_MAX_TOKENS)
+        except Exception as e:
+            print(f"Error summarizing conversation, keeping a truncated transcript: {e}")
+
+    # Without the LLM keep the most recent part of the transcript within the summary budget
+    combined = f"{previous_summary}\n{transcript}" if previous_summary else transcript
+    return truncate_to_tokens(combined, settings.SUMMARY_MAX_TOKENS, keep_end=True)
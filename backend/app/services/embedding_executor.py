@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import queue
+import sys
+import threading
+from collections import deque
+from typing import Any, Callable
+from app.core.config import settings
+
+# Lower values are picked up first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+class EmbeddingExecutor:
+    """
+    Dedicated worker threads for CPU-bound embedding and FAISS work.
+
+    Coroutines hand jobs to the executor and await the result, so the event loop
+    keeps serving other requests while the model runs. Jobs are served in priority
+    order: interactive query embeddings go ahead of queued ingestion batches.
+    Bulk submissions are bounded by the queue size and wait (without blocking the
+    event loop) while it is full; interactive submissions are never held back.
+    A worker that takes a bulk job off the queue hands the freed slot directly to
+    the longest waiting submission, so waiting submissions are not polled.
+    """
+
+    def __init__(self, num_workers: int, max_queue_size: int):
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self._queue = queue.PriorityQueue()
+        # Keeps FIFO order within a priority level and avoids comparing callables
+        self._sequence = itertools.count()
+        self._bulk_slots = self.max_queue_size
+        # (loop, future) of bulk submissions waiting for a slot, oldest first
+        self._bulk_waiters = deque()
+        self._bulk_lock = threading.Lock()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # Counters
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker, name=f"embedding-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            print(f"Started {self.num_workers} embedding worker threads")
+
+    async def run(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread and return its result.
+
+        Args:
+            fn: Blocking callable to run
+            priority: PRIORITY_INTERACTIVE for chat requests, PRIORITY_BULK for ingestion
+        """
+        self._ensure_started()
+
+        is_bulk = priority >= PRIORITY_BULK
+        if is_bulk:
+            await self._acquire_bulk_slot()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((priority, next(self._sequence), fn, args, kwargs, loop, future, is_bulk))
+        return await future
+
+    async def _acquire_bulk_slot(self):
+        """Take a bulk queue slot, waiting until a worker frees one if the queue is full"""
+        loop = asyncio.get_running_loop()
+        with self._bulk_lock:
+            if self._bulk_slots > 0:
+                self._bulk_slots -= 1
+                return
+            waiter = loop.create_future()
+            self._bulk_waiters.append((loop, waiter))
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._bulk_lock:
+                try:
+                    self._bulk_waiters.remove((loop, waiter))
+                    granted = False
+                except ValueError:
+                    # A worker already handed this waiter a slot
+                    granted = True
+            if granted and waiter.done() and not waiter.cancelled():
+                self._release_bulk_slot()
+            raise
+
+    def _release_bulk_slot(self):
+        """Give a freed bulk slot to the oldest waiter, or return it to the pool. Thread-safe."""
+        with self._bulk_lock:
+            if not self._bulk_waiters:
+                self._bulk_slots += 1
+                return
+            loop, waiter = self._bulk_waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(self._grant_bulk_slot, waiter)
+        except RuntimeError:
+            # The waiter's event loop has been closed
+            self._release_bulk_slot()
+
+    def _grant_bulk_slot(self, waiter):
+        if waiter.cancelled():
+            # The submission gave up before the slot arrived, pass it on
+            self._release_bulk_slot()
+        else:
+            waiter.set_result(None)
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Return executor counters for monitoring"""
+        return {
+            "workers": self.num_workers,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self.queue_depth(),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads once queued jobs have been handled"""
+        with self._lock:
+            for _ in self._threads:
+                self._queue.put((sys.maxsize, next(self._sequence), None, (), {}, None, None, False))
+            for thread in self._threads:
+                thread.join(timeout=5)
+            self._threads = []
+
+    def _worker(self):
+        while True:
+            _, _, fn, args, kwargs, loop, future, is_bulk = self._queue.get()
+            if fn is None:
+                break
+
+            if is_bulk:
+                self._release_bulk_slot()
+
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self.failed += 1
+                loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                self.completed += 1
+                loop.call_soon_threadsafe(_set_result, future, result)
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+def _set_exception(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+
+# Create the shared executor instance
+embedding_executor = EmbeddingExecutor(settings.EMBEDDING_WORKERS, settings.EMBEDDING_QUEUE_SIZE)
+
+def get_embedding_executor():
+    """Get the shared embedding executor"""
+    return embedding_executor
@@ -0,0 +1,36 @@
+import hashlib
+from typing import Dict, Iterable
+from app.db.sqlite_db import get_sqlite_client
+
+def chunk_content_hash(text: str, model_name: str) -> str:
+    """
+    Key a chunk's embedding by its whitespace-normalized text and the embedding model,
+    so identical text embedded by the same model can share one vector.
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.sha256(f"{model_name}\n{normalized}".encode('utf-8')).hexdigest()
+
+def load_stored_embeddings(tenant_id: str, content_hashes: Iterable[str]) -> Dict[str, bytes]:
+    """
+    Find embeddings already stored for chunks with the given content hashes.
+
+    Args:
+        tenant_id: Tenant whose chunks are searched
+        content_hashes: Hashes from chunk_content_hash
+
+    Returns:
+        Dictionary of content hash to the stored embedding BLOB
+    """
+    content_hashes = list(set(content_hashes))
+    if not content_hashes:
+        return {}
+
+    db = get_sqlite_client()
+    placeholders = ', '.join(['?'] * len(content_hashes))
+    with db.read_connection() as conn:
+        rows = conn.execute(
+            f"SELECT content_hash, embedding FROM document_chunks "
+            f"WHERE tenant_id = ? AND content_hash IN ({placeholders}) AND embedding IS NOT NULL",
+            [tenant_id] + content_hashes
+        ).fetchall()
+    return {row['content_hash']: row['embedding'] for row in rows}
@@ -0,0 +1,109 @@
+import time
+from typing import Any, Dict, Optional
+import httpx
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401  (needed by httpx for HTTP/2)
+    http2_available = True
+except ImportError:
+    http2_available = False
+
+class LLMHttpClient:
+    """
+    Application-lifetime HTTP client for LLM API calls.
+
+    One pooled httpx.AsyncClient is shared by all requests, so connections to the LLM
+    endpoint are kept alive and reused instead of paying a TCP and TLS handshake on
+    every chat turn. Requests are traced to count how many of them had to open a new
+    connection.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Counters
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.handshake_time_total = 0.0
+
+    def start(self):
+        """Create the pooled client, if it does not exist yet"""
+        if self._client is not None:
+            return
+
+        use_http2 = settings.LLM_HTTP2 and http2_available
+        if settings.LLM_HTTP2 and not http2_available:
+            print("HTTP/2 requested for LLM calls but the h2 package is not installed, using HTTP/1.1")
+
+        self._client = httpx.AsyncClient(
+            http2=use_http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+                read=settings.LLM_HTTP_READ_TIMEOUT,
+                write=settings.LLM_HTTP_WRITE_TIMEOUT,
+                pool=settings.LLM_HTTP_POOL_TIMEOUT,
+            ),
+        )
+        print(f"Created pooled LLM HTTP client ({'HTTP/2' if use_http2 else 'HTTP/1.1'}, max {settings.LLM_HTTP_MAX_CONNECTIONS} connections)")
+
+    async def close(self):
+        """Close the pooled client and its connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """Send a POST request over the shared connection pool"""
+        self.start()
+        return await self._client.post(url, extensions={"trace": self._make_trace()}, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        """Send a streaming request over the shared connection pool, for use with async with"""
+        self.start()
+        return self._client.stream(method, url, extensions={"trace": self._make_trace()}, **kwargs)
+
+    def _make_trace(self):
+        """Build an httpcore trace hook for one request, called at each phase of it"""
+        handshake_started = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+                self.requests += 1
+            elif event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+                handshake_started[event_name] = time.perf_counter()
+            elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                if event_name == "connection.connect_tcp.complete":
+                    self.connections_opened += 1
+                else:
+                    self.tls_handshakes += 1
+                started = handshake_started.pop(event_name.replace(".complete", ".started"), None)
+                if started is not None:
+                    self.handshake_time_total += time.perf_counter() - started
+
+        return trace
+
+    def stats(self) -> Dict[str, Any]:
+        """Return connection reuse counters for monitoring"""
+        reused = max(0, self.requests - self.connections_opened)
+        return {
+            "http2": settings.LLM_HTTP2 and http2_available,
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "connection_reuse_rate": reused / self.requests if self.requests else 0.0,
+            "handshake_time_total_ms": self.handshake_time_total * 1000,
+        }
+
+# Create the shared client instance
+llm_http_client = LLMHttpClient()
+
+def get_llm_http_client():
+    """Get the shared LLM HTTP client"""
+    return llm_http_client
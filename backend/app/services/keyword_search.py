@@ -0,0 +1,94 @@
+import re
+from typing import Any, Dict, List, Tuple
+from app.db.sqlite_db import get_sqlite_client
+
+# Common English words that carry no meaning for retrieval
+STOP_WORDS = {
+    'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 'and', 'any', 'are',
+    'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 'between', 'both', 'but',
+    'by', 'can', 'could', 'did', 'do', 'does', 'doing', 'down', 'during', 'each', 'few', 'for',
+    'from', 'further', 'had', 'has', 'have', 'having', 'he', 'her', 'here', 'hers', 'herself',
+    'him', 'himself', 'his', 'how', 'i', 'if', 'in', 'into', 'is', 'it', 'its', 'itself', 'just',
+    'me', 'more', 'most', 'my', 'myself', 'no', 'nor', 'not', 'now', 'of', 'off', 'on', 'once',
+    'only', 'or', 'other', 'our', 'ours', 'ourselves', 'out', 'over', 'own', 'please', 'same',
+    'she', 'should', 'so', 'some', 'such', 'than', 'that', 'the', 'their', 'theirs', 'them',
+    'themselves', 'then', 'there', 'these', 'they', 'this', 'those', 'through', 'to', 'too',
+    'under', 'until', 'up', 'very', 'was', 'we', 'were', 'what', 'when', 'where', 'which',
+    'while', 'who', 'whom', 'why', 'will', 'with', 'would', 'you', 'your', 'yours', 'yourself',
+    'yourselves'
+}
+
+def extract_keywords(query: str) -> List[str]:
+    """Split a query into lowercase word tokens, dropping stop words and duplicates"""
+    keywords = []
+    for token in re.findall(r'\w+', query.lower()):
+        if token not in STOP_WORDS and token not in keywords:
+            keywords.append(token)
+    return keywords
+
+def build_match_query(keywords: List[str], tenant_id: str) -> str:
+    """
+    Build an FTS5 MATCH expression that matches a tenant's chunks containing any keyword.
+    Each keyword is quoted so FTS5 operators in user text are treated as plain words.
+    """
+    tenant = tenant_id.replace('"', '""')
+    content = ' OR '.join(f'"{keyword}"' for keyword in keywords)
+    return f'tenant_id : "{tenant}" AND content : ({content})'
+
+def keyword_search(query: str, tenant_id: str, num_results: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Find the tenant's chunks that best match the query's keywords.
+    Ranking is done by SQLite with BM25 over the full-text index, so only the
+    top results are read into Python. The tenant filter is part of the MATCH, so
+    other tenants' chunks are never visited; the SQL filter on c.tenant_id only
+    guards against tenant IDs whose tokens contain another tenant's.
+
+    Returns:
+        List of (chunk, score) tuples, best match first. Scores are BM25 values,
+        where lower is better.
+    """
+    keywords = extract_keywords(query)
+    if not keywords:
+        return []
+
+    db = get_sqlite_client()
+    if not db.fts_available:
+        return _scan_keyword_search(keywords, tenant_id, num_results)
+
+    with db.read_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT c.id, c.document_id, c.content, c.chunk_index, bm25(document_chunks_fts, 1.0, 0.0) AS score
+            FROM document_chunks_fts
+            JOIN document_chunks c ON c.rowid = document_chunks_fts.rowid
+            WHERE document_chunks_fts MATCH ? AND c.tenant_id = ?
+            ORDER BY score
+            LIMIT ?
+            """,
+            (build_match_query(keywords, tenant_id), tenant_id, num_results)
+        ).fetchall()
+
+    results = []
+    for row in rows:
+        chunk = dict(row)
+        score = chunk.pop('score')
+        results.append((chunk, score))
+    return results
+
+def _scan_keyword_search(keywords: List[str], tenant_id: str, num_results: int):
+    """
+    Keyword search without FTS5: count whole-word keyword matches in every chunk.
+    Scores are negated match counts so that lower is better, as with BM25.
+    """
+    db = get_sqlite_client()
+    chunks = db.table('document_chunks').select('id, document_id, content, chunk_index').eq('tenant_id', tenant_id).execute().data
+
+    relevant_chunks = []
+    for chunk in chunks:
+        words = set(re.findall(r'\w+', chunk['content'].lower()))
+        matches = sum(1 for keyword in keywords if keyword in words)
+        if matches:
+            relevant_chunks.append((chunk, -float(matches)))
+
+    relevant_chunks.sort(key=lambda x: x[1])
+    return relevant_chunks[:num_results]
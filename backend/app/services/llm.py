@@ -1,93 +1,110 @@
 from typing import List, Dict, Any, Optional
 from uuid import UUID, uuid4
-import httpx
+import hashlib
 import json
 import os
 import re
+import tempfile
+import time
+import threading
 from datetime import datetime
 import asyncio
+from itertools import islice
+from fastapi.concurrency import run_in_threadpool
 from app.db.supabase import get_supabase_client
 from app.core.config import settings
-from app.db.sqlite_db import get_sqlite_client
+from app.db.sqlite_db import get_sqlite_client, READ_BACK_BATCH_SIZE
+from app.services.vector_index import get_index_registry, index_file_path, index_version, remove_stale_index_files
+from app.services.vector_codec import encode_embedding, decode_embedding, is_full_precision
+from app.services.embedding_executor import get_embedding_executor, PRIORITY_BULK
+from app.services.query_cache import get_query_embedding_cache
+from app.services.keyword_search import keyword_search
+from app.services.result_cache import get_retrieval_result_cache
+from app.services.http_client import get_llm_http_client
+from app.services.singleflight import get_retrieval_flights, get_completion_flights
+from app.services.conversation_memory import fit_history_to_budget
+from app.services.context_packing import pack_context
+from app.services.chunking import iter_chunks
+from app.services.embedding_store import chunk_content_hash, load_stored_embeddings
+from app.services.response_cache import get_semantic_response_cache, tenant_response_cache_settings, hash_context, is_first_turn
 
-# Try to import the vector similarity packages, but install them if they're not available
+# The vector search packages and the embedding model are slow to import and load, so they
+# are loaded on a background thread after startup (see load_embedding_model). Until then
+# vector_search_available stays False and retrieval serves keyword results only.
+np = None
+faiss = None
 vector_search_available = False
 embedding_model = None
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
 
-try:
-    # First try to import
-    import numpy as np
-    from sentence_transformers import SentenceTransformer
-    import faiss
-    
-    # If we get here, imports worked, so initialize the model
-    print("Vector search dependencies found, initializing model...")
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("Sentence Transformer model loaded successfully")
-    vector_search_available = True
-except ImportError as e:
-    print(f"Vector search dependencies not available: {e}")
+embedding_model_state = {
+    "state": "not_loaded",  # not_loaded, loading, ready, unavailable or failed
+    "error": None,
+    "load_seconds": None,
+}
+_model_ready = threading.Event()
+_model_loader_lock = threading.Lock()
+_model_loader_thread = None
+
+def load_embedding_model():
+    """
+    Import the vector search packages, load the embedding model and warm it up.
+    Blocking; normally runs on the thread started by start_embedding_model_loader.
+    """
+    global np, faiss, embedding_model, vector_search_available
+    
+    embedding_model_state["state"] = "loading"
+    start = time.perf_counter()
     try:
-        print("Attempting to install missing dependencies...")
-        import subprocess
-        import sys
-        
-        # Install necessary packages
-        subprocess.check_call([sys.executable, "-m", "pip", "install", 
-                             "numpy>=1.22.0", 
-                             "sentence-transformers>=2.2.2", 
-                             "faiss-cpu>=1.7.4"])
-        
-        # Now try import again
         import numpy as np
-        from sentence_transformers import SentenceTransformer
         import faiss
+        from sentence_transformers import SentenceTransformer
+        
+        print("Vector search dependencies found, initializing model...")
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        # The first encode call allocates buffers, pay for it before the first user query
+        model.encode("warm up")
         
-        # Initialize model
-        print("Dependencies installed successfully, initializing model...")
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Sentence Transformer model loaded successfully")
+        embedding_model = model
         vector_search_available = True
-    except Exception as install_error:
-        print(f"Failed to install dependencies: {install_error}")
-        embedding_model = None
-        vector_search_available = False
-except Exception as other_error:
-    print(f"Other error with vector search setup: {other_error}")
-    embedding_model = None
-    vector_search_available = False
+        embedding_model_state["state"] = "ready"
+        print(f"Sentence Transformer model loaded successfully in {time.perf_counter() - start:.2f}s")
+    except ImportError as e:
+        print(f"Vector search dependencies not available: {e}")
+        embedding_model_state["state"] = "unavailable"
+        embedding_model_state["error"] = str(e)
+    except Exception as e:
+        print(f"Other error with vector search setup: {e}")
+        embedding_model_state["state"] = "failed"
+        embedding_model_state["error"] = str(e)
+    finally:
+        embedding_model_state["load_seconds"] = time.perf_counter() - start
+        _model_ready.set()
 
-# Maximum chunk size for document processing
-MAX_CHUNK_SIZE = 500  # words
+def start_embedding_model_loader():
+    """Start loading the embedding model on a background thread, if not already started"""
+    global _model_loader_thread
+    with _model_loader_lock:
+        if _model_loader_thread is None:
+            _model_loader_thread = threading.Thread(target=load_embedding_model, name="embedding-model-loader", daemon=True)
+            _model_loader_thread.start()
 
-def split_text_into_chunks(text: str, max_chunk_size: int) -> List[str]:
-    """
-    Split text into chunks based on max chunk size (in words).
-    """
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Split by words
-    words = text.split()
-    
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for word in words:
-        if current_size < max_chunk_size:
-            current_chunk.append(word)
-            current_size += 1
-        else:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_size = 1
-    
-    # Add the last chunk if it's not empty
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    return chunks
+async def wait_for_embedding_model():
+    """Wait, without blocking the event loop, until the model has loaded or failed to load"""
+    start_embedding_model_loader()
+    if not _model_ready.is_set():
+        await asyncio.get_running_loop().run_in_executor(None, _model_ready.wait)
+
+def get_embedding_model_status() -> Dict[str, Any]:
+    """Return the embedding model's readiness for status endpoints"""
+    return {
+        "vector_search_available": vector_search_available,
+        "model_loaded": embedding_model is not None,
+        "model_name": embedding_model.__class__.__name__ if embedding_model else None,
+        "model_state": embedding_model_state["state"],
+        "model_error": embedding_model_state["error"],
+        "model_load_seconds": embedding_model_state["load_seconds"],
+    }
 
 def generate_embedding(text: str) -> List[float]:
     """Generate embedding vector for text using Sentence Transformers."""
@@ -104,11 +121,97 @@ def generate_embedding(text: str) -> List[float]:
         print(f"Error generating embedding: {e}")
         return []
 
+# Running totals for batched embedding generation, reported by /vector-status
+embedding_stats = {
+    "chunks_embedded": 0,
+    "chunks_reused": 0,  # stored embeddings reused for identical chunk text
+    "seconds_spent": 0.0,
+    "last_batch_size": 0,
+    "last_chunks_per_sec": 0.0,
+}
+
+async def generate_embeddings(texts: List[str], batch_size: Optional[int] = None) -> List[Any]:
+    """
+    Generate embedding vectors for many texts, encoding them in batches.
+    
+    Each batch runs on the embedding executor at bulk priority, so chat queries
+    can be served between batches of a large upload.
+    
+    Args:
+        texts: Texts to embed
+        batch_size: Number of texts per encode call (defaults to EMBEDDING_BATCH_SIZE)
+        
+    Returns:
+        List of float32 vectors in the same order as texts (empty for texts that failed)
+    """
+    # Ingestion waits for the model instead of storing chunks without embeddings
+    await wait_for_embedding_model()
+    
+    if not vector_search_available or embedding_model is None:
+        print("Skipping embedding generation as vector search is not available")
+        return [[] for _ in texts]
+    
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    start = time.perf_counter()
+    
+    executor = get_embedding_executor()
+    embeddings = []
+    for offset in range(0, len(texts), batch_size):
+        batch = texts[offset:offset + batch_size]
+        embeddings.extend(await executor.run(_encode_batch, batch, priority=PRIORITY_BULK))
+    
+    elapsed = time.perf_counter() - start
+    chunks_per_sec = len(texts) / elapsed if elapsed > 0 else 0.0
+    embedding_stats["chunks_embedded"] += len(texts)
+    embedding_stats["seconds_spent"] += elapsed
+    embedding_stats["last_batch_size"] = batch_size
+    embedding_stats["last_chunks_per_sec"] = chunks_per_sec
+    print(f"Generated {len(texts)} embeddings in {elapsed:.2f}s ({chunks_per_sec:.1f} chunks/sec, batch size {batch_size})")
+    
+    return embeddings
+
+def _encode_batch(texts: List[str]) -> List[Any]:
+    """Encode one batch, retrying in halves if the model fails on it."""
+    try:
+        return list(embedding_model.encode(texts, batch_size=len(texts)))
+    except Exception as e:
+        if len(texts) == 1:
+            print(f"Error generating embedding: {e}")
+            return [[]]
+        
+        print(f"Error encoding batch of {len(texts)} texts, retrying with smaller batches: {e}")
+        half = len(texts) // 2
+        return _encode_batch(texts[:half]) + _encode_batch(texts[half:])
+
+# Supported FAISS index layouts
+INDEX_TYPES = ('flat', 'sq8', 'pq', 'hnsw', 'ivf_flat', 'ivf_pq')
+# Layouts that store lossy codes, whose candidates are re-ranked against stored vectors
+COMPRESSED_INDEX_TYPES = ('sq8', 'pq', 'ivf_pq')
+# Layouts that compact remaining vectors in order when some are removed
+FLAT_CODE_INDEX_TYPES = ('flat', 'sq8', 'pq')
+
+def select_index_type(num_vectors: int) -> str:
+    """Pick an index type for a corpus of the given size."""
+    if num_vectors >= settings.VECTOR_INDEX_IVF_PQ_THRESHOLD:
+        return 'ivf_pq'
+    if num_vectors >= settings.VECTOR_INDEX_IVF_THRESHOLD:
+        return 'ivf_flat'
+    if num_vectors >= settings.VECTOR_INDEX_HNSW_THRESHOLD:
+        return 'hnsw'
+    return 'flat'
+
 class FAISSRetriever:
     """Vector similarity search using FAISS"""
     
-    def __init__(self):
-        """Initialize the FAISS retriever"""
+    def __init__(self, index_type: Optional[str] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Initialize the FAISS retriever
+        
+        Args:
+            index_type: One of INDEX_TYPES, or "auto" to choose one from the corpus size
+            nprobe: Number of IVF lists visited per query
+            ef_search: Size of the HNSW candidate list per query
+        """
         if not vector_search_available:
             print("FAISS retriever initialized without vector search capabilities")
             self.available = False
@@ -117,45 +220,214 @@ class FAISSRetriever:
         self.available = True
         self.dimension = 384  # Dimension of the all-MiniLM-L6-v2 model
         self.index = None
-        self.chunks = None
-        self.embeddings = None
+        self.index_type = None
+        self.requested_index_type = index_type or settings.VECTOR_INDEX_TYPE
+        self.nprobe = nprobe or settings.VECTOR_INDEX_NPROBE
+        self.ef_search = ef_search or settings.VECTOR_INDEX_EF_SEARCH
+        self.chunks = []
+        self.deleted = 0  # Chunks removed from an index that can't drop vectors in place
+        self.content_bytes = 0
+        self.training = False
+        # Callable returning {chunk_id: full-precision vector} used to re-rank compressed results
+        self.vector_loader = None
+        # Set to the index data file when the index was opened memory-mapped from disk
+        self.mapped_path = None
+        # Where save() writes the index, if persistence is enabled
+        self.persist_path = None
+        # Bumped whenever positions change, so a background build started earlier is discarded
+        self.generation = 0
+        # Searches run on executor threads while documents are added or removed
+        self.lock = threading.RLock()
     
-    def fit(self, chunks, embeddings):
+    def fit(self, chunks, embeddings, background: bool = True):
         """
         Build a FAISS index from embeddings
         
         Args:
             chunks: List of document chunks
             embeddings: List of embedding vectors corresponding to chunks
+            background: Serve an exact index while an approximate one is trained in a
+                background thread, instead of training before returning
         """
         if not self.available:
             print("Cannot fit FAISS index: vector search not available")
             return
             
-        self.chunks = chunks
-        self.embeddings = embeddings
-        
-        # Create FAISS index - using L2 distance
-        self.index = faiss.IndexFlatL2(self.dimension)
+        with self.lock:
+            self.chunks = list(chunks)
+            self.deleted = 0
+            self.content_bytes = sum(len(chunk.get('content') or '') for chunk in self.chunks)
+            self.generation += 1
+            
+            # Start with an empty exact index - using L2 distance
+            self.index = faiss.IndexFlatL2(self.dimension)
+            self.index_type = 'flat'
+            
+            # Make sure we have valid embeddings
+            if embeddings is None or len(embeddings) == 0:
+                print("No valid embeddings to fit into FAISS index")
+                return
+                
+            # Convert embeddings to numpy array
+            try:
+                embedding_array = np.asarray(embeddings, dtype='float32')
+                
+                # Only add vectors if we have the right shape
+                if embedding_array.shape[1] != self.dimension:
+                    print(f"Error: Embedding dimension mismatch. Expected {self.dimension}, got {embedding_array.shape[1]}")
+                    return
+                    
+                target_type = self._target_index_type(len(embedding_array))
+                if target_type == 'flat' or background:
+                    self.index.add(embedding_array)
+                    print(f"FAISS index built with {len(embeddings)} vectors")
+                    if target_type != 'flat':
+                        self._start_background_build(target_type, embedding_array)
+                else:
+                    self.index = self._build_index(target_type, embedding_array)
+                    self.index_type = target_type
+                    print(f"FAISS {target_type} index built with {len(embeddings)} vectors")
+            except Exception as e:
+                print(f"Error building FAISS index: {e}")
+    
+    def add(self, chunks, embeddings):
+        """
+        Append chunks to an already built index without rebuilding it.
+        Chunks the index already holds are skipped; an index built while a document was
+        being stored may already contain the chunks committed so far.
         
-        # Make sure we have valid embeddings
-        if not embeddings or len(embeddings) == 0:
-            print("No valid embeddings to fit into FAISS index")
-            return
+        Args:
+            chunks: List of document chunks
+            embeddings: List of embedding vectors corresponding to chunks
             
-        # Convert embeddings to numpy array
-        try:
-            embedding_array = np.array(embeddings).astype('float32')
+        Raises:
+            Exception: If a memory-mapped index could not be made writable; the index
+                then no longer reflects the stored chunks and should be rebuilt
+        """
+        if not self.available:
+            return
             
-            # Only add vectors if we have the right shape
-            if embedding_array.shape[1] == self.dimension:
-                # Add vectors to the index
+        with self.lock:
+            if self.index is None:
+                self.fit(chunks, embeddings)
+                return
+                
+            if embeddings is None or len(embeddings) == 0:
+                return
+                
+            try:
+                embedding_array = np.asarray(embeddings, dtype='float32')
+                
+                if embedding_array.shape[1] != self.dimension:
+                    print(f"Error: Embedding dimension mismatch. Expected {self.dimension}, got {embedding_array.shape[1]}")
+                    return
+                    
+                held_ids = {chunk['id'] for chunk in self.chunks if chunk}
+                new_positions = [i for i, chunk in enumerate(chunks) if chunk['id'] not in held_ids]
+                if len(new_positions) < len(chunks):
+                    chunks = [chunks[i] for i in new_positions]
+                    embedding_array = embedding_array[new_positions]
+                    if not chunks:
+                        return
+            except Exception as e:
+                print(f"Error adding to FAISS index: {e}")
+                return
+                
+            self._make_writable()
+            try:
                 self.index.add(embedding_array)
-                print(f"FAISS index built with {len(embeddings)} vectors")
+                self.chunks.extend(chunks)
+                self.content_bytes += sum(len(chunk.get('content') or '') for chunk in chunks)
+                print(f"Added {len(chunks)} vectors to FAISS index ({self.index.ntotal} total)")
+                self._maybe_upgrade()
+            except Exception as e:
+                print(f"Error adding to FAISS index: {e}")
+    
+    def remove_document(self, document_id):
+        """
+        Remove all chunks belonging to a document from the index
+        
+        Args:
+            document_id: ID of the document whose chunks should be removed
+            
+        Returns:
+            Number of vectors removed
+        """
+        if not self.available or self.index is None:
+            return 0
+            
+        with self.lock:
+            positions = [i for i, chunk in enumerate(self.chunks) if chunk and chunk.get('document_id') == document_id]
+            if not positions:
+                return 0
+                
+            if self.index_type in FLAT_CODE_INDEX_TYPES:
+                # Flat code indexes compact remaining vectors in order, so the chunk list stays aligned
+                self._make_writable()
+                # A rebuilt copy has no tombstones, so positions may have moved
+                positions = [i for i, chunk in enumerate(self.chunks) if chunk.get('document_id') == document_id]
+                self.index.remove_ids(np.array(positions, dtype='int64'))
+                self.chunks = [chunk for chunk in self.chunks if chunk.get('document_id') != document_id]
+                self.generation += 1
+                self._maybe_upgrade()
             else:
-                print(f"Error: Embedding dimension mismatch. Expected {self.dimension}, got {embedding_array.shape[1]}")
-        except Exception as e:
-            print(f"Error building FAISS index: {e}")
+                # HNSW can't drop vectors, so leave tombstones that search skips
+                for position in positions:
+                    self.chunks[position] = None
+                self.deleted += len(positions)
+                
+            self.content_bytes = sum(len(chunk.get('content') or '') for chunk in self.chunks if chunk)
+            print(f"Removed {len(positions)} vectors for document {document_id} from FAISS index")
+            return len(positions)
+    
+    def replace_document(self, document_id, chunks, embeddings):
+        """
+        Replace all chunks of a document with a new set in one step; searches running
+        concurrently see either the old or the new chunks, never a mix or neither
+        
+        Args:
+            document_id: ID of the document being replaced
+            chunks: The document's current chunks
+            embeddings: Embedding vectors corresponding to chunks
+        """
+        if not self.available:
+            return
+            
+        with self.lock:
+            self.remove_document(document_id)
+            self.add(chunks, embeddings)
+    
+    def needs_rebuild(self):
+        """Whether enough chunks were tombstoned that the index should be rebuilt"""
+        if not self.available or self.index is None or self.index.ntotal == 0:
+            return False
+        return self.deleted > self.index.ntotal * 0.25
+    
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Tune the recall/latency trade-off of approximate indexes"""
+        with self.lock:
+            if nprobe:
+                self.nprobe = nprobe
+            if ef_search:
+                self.ef_search = ef_search
+            self._apply_search_params(self.index)
+    
+    def memory_bytes(self):
+        """Approximate memory held by the index vectors and chunk texts"""
+        if not self.available or self.index is None:
+            return 0
+        if self.mapped_path:
+            # Mapped vectors live in the shared page cache, not in this worker's heap
+            return self.content_bytes
+        per_vector = {
+            'flat': self.dimension * 4,
+            'sq8': self.dimension,
+            'pq': settings.VECTOR_INDEX_PQ_M,
+            'hnsw': self.dimension * 4 + settings.VECTOR_INDEX_HNSW_M * 2 * 4,
+            'ivf_flat': self.dimension * 4 + 8,
+            'ivf_pq': settings.VECTOR_INDEX_PQ_M + 8,
+        }[self.index_type]
+        return self.index.ntotal * per_vector + self.content_bytes
     
     def search(self, query_vector, k=5):
         """
@@ -179,16 +451,317 @@ class FAISSRetriever:
         # Convert query vector to numpy array
         query_array = np.array([query_vector]).astype('float32')
         
-        # Search the index
-        distances, indices = self.index.search(query_array, k)
+        # Compressed codes only approximate distances, so fetch extra candidates and re-rank them
+        rerank = self.index_type in COMPRESSED_INDEX_TYPES and self.vector_loader is not None
+        num_candidates = k * settings.VECTOR_INDEX_RERANK_FACTOR if rerank else k
+        
+        with self.lock:
+            # Search the index, fetching extra candidates to make up for tombstones
+            distances, indices = self.index.search(query_array, min(num_candidates + self.deleted, self.index.ntotal))
+            
+            # Return results with distances
+            results = []
+            for i, idx in enumerate(indices[0]):
+                if idx != -1 and idx < len(self.chunks) and self.chunks[idx] is not None:  # -1 indicates no result
+                    results.append((self.chunks[idx], float(distances[0][i])))
+                    if len(results) == num_candidates:
+                        break
+                        
+        if rerank:
+            results = self._rerank(query_array[0], results)
+            
+        return results[:k]
+    
+    def _rerank(self, query_vector, results):
+        """Re-order candidates by exact L2 distance to their full-precision vectors, where available"""
+        try:
+            vectors = self.vector_loader([chunk['id'] for chunk, _ in results])
+        except Exception as e:
+            print(f"Error loading vectors for re-ranking: {e}")
+            return results
+            
+        reranked = []
+        for chunk, distance in results:
+            vector = vectors.get(chunk['id'])
+            if vector is not None:
+                difference = query_vector - np.asarray(vector, dtype='float32')
+                distance = float(np.dot(difference, difference))
+            reranked.append((chunk, distance))
+            
+        reranked.sort(key=lambda result: result[1])
+        return reranked
+    
+    def save(self):
+        """
+        Write the index and its chunk ID order for persist_path.
+        
+        The index data goes to a new file with a unique name, which is never overwritten.
+        The metadata file at persist_path + ".json" names that data file and is replaced
+        in one rename, so readers always see a matching pair, and workers saving the same
+        version at the same time don't write to each other's files.
+        """
+        if not self.available or not self.persist_path or self.index is None:
+            return
+            
+        directory = os.path.dirname(self.persist_path) or '.'
+        prefix = f"{os.path.basename(self.persist_path)}."
+        metadata_path = f"{self.persist_path}.json"
+        index_path = None
+        try:
+            with self.lock:
+                fd, index_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.index')
+                os.close(fd)
+                faiss.write_index(self.index, index_path)
+                metadata = {
+                    "index_type": self.index_type,
+                    "index_file": os.path.basename(index_path),
+                    "chunk_ids": [chunk['id'] if chunk else None for chunk in self.chunks]
+                }
+                
+            previous_index_path = self._saved_index_path(self.persist_path)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.json.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, metadata_path)
+            index_path = None
+            print(f"Saved FAISS {metadata['index_type']} index to {metadata_path}")
+            
+            # Workers that still have the previous file mapped keep reading it until they close it
+            if previous_index_path and previous_index_path != self.mapped_path:
+                try:
+                    os.remove(previous_index_path)
+                except FileNotFoundError:
+                    pass
+        except Exception as e:
+            print(f"Error saving FAISS index to {self.persist_path}: {e}")
+            if index_path:
+                try:
+                    os.remove(index_path)
+                except OSError:
+                    pass
+    
+    @staticmethod
+    def _saved_index_path(path):
+        """The index data file named by the metadata file saved for path, if any"""
+        try:
+            with open(f"{path}.json", 'r') as f:
+                index_file = json.load(f).get("index_file")
+        except (OSError, ValueError):
+            return None
+        return os.path.join(os.path.dirname(path), index_file) if index_file else None
+    
+    def load(self, path, chunks):
+        """
+        Open an index written by save(), memory-mapped where FAISS supports it.
         
-        # Return results with distances
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.chunks):  # -1 indicates no result
-                results.append((self.chunks[idx], float(distances[0][i])))
+        Args:
+            path: Index path the index was saved for
+            chunks: The tenant's current chunks (without embeddings), matched to index positions by ID
+            
+        Returns:
+            True if the index was loaded and matches the given chunks
+        """
+        if not self.available or not os.path.exists(f"{path}.json"):
+            return False
+            
+        try:
+            with open(f"{path}.json", 'r') as f:
+                metadata = json.load(f)
+            index_path = os.path.join(os.path.dirname(path), metadata["index_file"])
+                
+            # IVF inverted lists are mapped with IO_FLAG_MMAP, flat code storage only with
+            # IO_FLAG_MMAP_IFC on newer FAISS releases; HNSW graphs are read into memory
+            index_type = metadata["index_type"]
+            if index_type in ('ivf_flat', 'ivf_pq'):
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            elif index_type in FLAT_CODE_INDEX_TYPES and hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+                flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+            else:
+                flags = 0
+            index = faiss.read_index(index_path, flags)
+            
+            chunks_by_id = {chunk['id']: chunk for chunk in chunks}
+            chunk_ids = metadata["chunk_ids"]
+            live_ids = [chunk_id for chunk_id in chunk_ids if chunk_id]
+            if index.ntotal != len(chunk_ids) or len(live_ids) != len(chunks_by_id) or any(chunk_id not in chunks_by_id for chunk_id in live_ids):
+                print(f"Ignoring FAISS index at {path}: it does not match the stored chunks")
+                return False
                 
-        return results
+            with self.lock:
+                self.index = index
+                self.index_type = index_type
+                self.chunks = [chunks_by_id[chunk_id] if chunk_id else None for chunk_id in chunk_ids]
+                self.deleted = chunk_ids.count(None)
+                self.content_bytes = sum(len(chunk.get('content') or '') for chunk in self.chunks if chunk)
+                self.mapped_path = index_path if flags else None
+                self.persist_path = path
+                self.generation += 1
+                self._apply_search_params(self.index)
+            print(f"Opened FAISS {self.index_type} index with {index.ntotal} vectors from {path}")
+            return True
+        except Exception as e:
+            print(f"Error loading FAISS index from {path}: {e}")
+            return False
+    
+    def _make_writable(self):
+        """
+        Replace a memory-mapped index with a private in-memory copy before modifying it.
+        
+        Mapped indexes are read-only and shared with other workers. Serializing one is not
+        a copy: the inverted lists of a mapped IVF index serialize as a reference to the
+        same file, which would then be mapped writable. So the file is read again without
+        mmap, or, if it is gone, the index is rebuilt from the stored vectors.
+        """
+        if not self.mapped_path:
+            return
+            
+        try:
+            self.index = faiss.read_index(self.mapped_path)
+        except Exception as e:
+            print(f"Could not re-read FAISS index from {self.mapped_path}, rebuilding it from stored vectors: {e}")
+            self._rebuild_from_stored_vectors()
+        self._apply_search_params(self.index)
+        self.mapped_path = None
+    
+    def _rebuild_from_stored_vectors(self):
+        """
+        Replace the index with an exact one built from the database vectors of the live chunks.
+        Callers that grow the index upgrade it to the configured type again via _maybe_upgrade.
+        """
+        live_chunks = [chunk for chunk in self.chunks if chunk]
+        vectors = load_chunk_embeddings([chunk['id'] for chunk in live_chunks], full_precision_only=False)
+        self.chunks = [chunk for chunk in live_chunks if chunk['id'] in vectors]
+        self.deleted = 0
+        self.content_bytes = sum(len(chunk.get('content') or '') for chunk in self.chunks)
+        self.generation += 1
+        
+        self.index = faiss.IndexFlatL2(self.dimension)
+        self.index_type = 'flat'
+        if self.chunks:
+            self.index.add(np.asarray([vectors[chunk['id']] for chunk in self.chunks], dtype='float32'))
+    
+    def _target_index_type(self, num_vectors):
+        if self.requested_index_type not in INDEX_TYPES:
+            return select_index_type(num_vectors)
+        # 8-bit product quantization needs at least 256 training points
+        if self.requested_index_type == 'ivf_pq' and num_vectors < 256:
+            return 'ivf_flat'
+        if self.requested_index_type == 'pq' and num_vectors < 256:
+            return 'sq8'
+        return self.requested_index_type
+    
+    def _build_index(self, index_type, embedding_array):
+        """Create, train and fill an index of the given type"""
+        num_vectors = len(embedding_array)
+        
+        if index_type == 'sq8':
+            # One byte per dimension, trained on the per-dimension value ranges
+            index = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_8bit)
+            index.train(embedding_array)
+        elif index_type == 'pq':
+            index = faiss.IndexPQ(self.dimension, settings.VECTOR_INDEX_PQ_M, 8)
+            index.train(embedding_array)
+        elif index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(self.dimension, settings.VECTOR_INDEX_HNSW_M)
+            index.hnsw.efConstruction = settings.VECTOR_INDEX_EF_CONSTRUCTION
+        elif index_type in ('ivf_flat', 'ivf_pq'):
+            # FAISS wants roughly 39 training points per list
+            nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+            quantizer = faiss.IndexFlatL2(self.dimension)
+            if index_type == 'ivf_pq':
+                index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, settings.VECTOR_INDEX_PQ_M, 8)
+            else:
+                index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist)
+            
+            # Train on a sample, k-means cost grows with the number of points
+            training_set = embedding_array
+            max_training_points = nlist * 256
+            if num_vectors > max_training_points:
+                sample = np.random.default_rng(0).choice(num_vectors, max_training_points, replace=False)
+                training_set = embedding_array[sample]
+            index.train(training_set)
+        else:
+            index = faiss.IndexFlatL2(self.dimension)
+            
+        self._apply_search_params(index)
+        index.add(embedding_array)
+        return index
+    
+    def _apply_search_params(self, index):
+        if index is None:
+            return
+        if hasattr(index, 'nprobe'):
+            index.nprobe = self.nprobe
+        if hasattr(index, 'hnsw'):
+            index.hnsw.efSearch = self.ef_search
+    
+    def _maybe_upgrade(self):
+        """Switch a grown exact index to an approximate one in the background"""
+        if self.training or self.index_type != 'flat' or self.index.ntotal == 0:
+            return
+        target_type = self._target_index_type(self.index.ntotal)
+        if target_type != 'flat':
+            self._start_background_build(target_type, self.index.reconstruct_n(0, self.index.ntotal))
+    
+    def _start_background_build(self, index_type, embedding_array):
+        self.training = True
+        thread = threading.Thread(
+            target=self._background_build,
+            args=(index_type, embedding_array, self.generation),
+            daemon=True
+        )
+        thread.start()
+        print(f"Training FAISS {index_type} index for {len(embedding_array)} vectors in the background")
+    
+    def _background_build(self, index_type, embedding_array, generation):
+        try:
+            start = time.perf_counter()
+            index = self._build_index(index_type, embedding_array)
+            
+            with self.lock:
+                if generation != self.generation:
+                    print(f"Discarding background FAISS {index_type} index, chunks changed while training")
+                    return
+                    
+                # Catch up on vectors added to the exact index while we were training
+                if self.index.ntotal > index.ntotal:
+                    index.add(self.index.reconstruct_n(index.ntotal, self.index.ntotal - index.ntotal))
+                    
+                self.index = index
+                self.index_type = index_type
+            print(f"Switched to FAISS {index_type} index with {index.ntotal} vectors after {time.perf_counter() - start:.1f}s")
+            self.save()
+        except Exception as e:
+            print(f"Error training FAISS {index_type} index, keeping exact search: {e}")
+        finally:
+            with self.lock:
+                self.training = False
+                # The corpus changed while we were training, start over from the current vectors
+                if generation != self.generation:
+                    self._maybe_upgrade()
+
+async def _embed_chunk_batch(tenant_id: str, chunks: List[str], content_hashes: List[str]):
+    """
+    Get stored-format embeddings for a batch of chunks.
+    
+    Embeddings already stored for chunks with the same content hash, e.g. the unchanged
+    parts of a re-uploaded manual, are reused; only new text is encoded.
+    
+    Returns:
+        Tuple of (content hash to embedding BLOB, number of chunks that reused an embedding);
+        chunks that could not be embedded have no entry
+    """
+    stored = load_stored_embeddings(tenant_id, content_hashes)
+    new_texts = {}
+    for chunk, content_hash in zip(chunks, content_hashes):
+        if content_hash not in stored:
+            new_texts.setdefault(content_hash, chunk)
+    if new_texts:
+        for content_hash, embedding in zip(new_texts, await generate_embeddings(list(new_texts.values()))):
+            if len(embedding) > 0:
+                stored[content_hash] = encode_embedding(embedding, settings.EMBEDDING_STORAGE_DTYPE)
+    reused = sum(1 for content_hash in content_hashes if content_hash not in new_texts)
+    return stored, reused
 
 async def process_document(document_id: str, file_path: str, document_type: str, tenant_id: str):
     """
@@ -198,169 +771,554 @@ async def process_document(document_id: str, file_path: str, document_type: str,
     
     try:
         # Update document status to processing
-        db.table('documents').update({"embedding_status": "processing"}).eq('id', document_id).execute()
-        
-        # Download file from storage
-        content = db.storage.from_("documents").download(file_path)
-        
-        # Convert bytes to text based on document type
-        text = ""
-        try:
-            if document_type.lower() in ['txt', 'text']:
-                text = content.decode('utf-8')
-            elif document_type.lower() in ['pdf', 'doc', 'docx']:
-                # In a real implementation, we'd use libraries like PyPDF2 or python-docx
-                # For this demo, we'll treat the content as plain text
-                text = content.decode('utf-8', errors='ignore')
-            else:
-                text = content.decode('utf-8', errors='ignore')
-        except Exception as e:
-            print(f"Error decoding document: {e}")
-            text = content.decode('utf-8', errors='ignore')
-        
-        # Split text into chunks
-        chunks = split_text_into_chunks(text, MAX_CHUNK_SIZE)
+        await run_in_threadpool(db.table('documents').update({"embedding_status": "processing"}, returning='minimal').eq('id', document_id).execute)
         
-        # Store chunks in database with embeddings
+        # Read the file from storage a block at a time and split it into sentence-aligned
+        # chunks as it is read, so large documents are never held in memory whole.
+        # In a real implementation PDF and Word documents would go through a text extractor
+        # like PyPDF2 or python-docx; for this demo every document_type is read as UTF-8 text.
         now = datetime.utcnow().isoformat()
-        for i, chunk in enumerate(chunks):
-            chunk_id = str(uuid4())
-            
-            # Generate embedding for this chunk
-            embedding = generate_embedding(chunk)
+        chunk_index = 0
+        reused_chunks = 0
+        
+        with db.storage.from_("documents").open(file_path) as file:
+            chunks = iter_chunks(file, settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+            batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
             
-            # Store chunk and its embedding in database
-            db.table('document_chunks').insert({
-                "id": chunk_id,
-                "document_id": document_id,
-                "tenant_id": tenant_id,
-                "content": chunk,
-                "chunk_index": i,
-                "embedding": json.dumps(embedding) if embedding else None,
-                "created_at": now
-            }).execute()
+            while True:
+                batch = list(islice(chunks, batch_size))
+                if not batch:
+                    break
+                
+                content_hashes = [chunk_content_hash(chunk, EMBEDDING_MODEL_NAME) for chunk in batch]
+                stored, reused = await _embed_chunk_batch(tenant_id, batch, content_hashes)
+                reused_chunks += reused
+                
+                rows = []
+                indexed_chunks = []
+                indexed_embeddings = []
+                for chunk, content_hash in zip(batch, content_hashes):
+                    chunk_id = str(uuid4())
+                    stored_embedding = stored.get(content_hash)
+                    rows.append({
+                        "id": chunk_id,
+                        "document_id": document_id,
+                        "tenant_id": tenant_id,
+                        "content": chunk,
+                        "chunk_index": chunk_index,
+                        "embedding": stored_embedding,
+                        "content_hash": content_hash,
+                        "created_at": now
+                    })
+                    
+                    if stored_embedding is not None:
+                        indexed_chunks.append({
+                            "id": chunk_id,
+                            "document_id": document_id,
+                            "content": chunk,
+                            "chunk_index": chunk_index
+                        })
+                        indexed_embeddings.append(decode_embedding(stored_embedding))
+                    chunk_index += 1
+                
+                # Store the batch's chunks and embeddings in one transaction, then add them
+                # to the tenant's cached vector index so only one batch is held at a time.
+                # The index update may copy or rebuild the index, so it runs on a worker thread
+                await run_in_threadpool(db.table('document_chunks').insert(rows, returning='minimal').execute)
+                if indexed_chunks:
+                    await get_embedding_executor().run(
+                        get_index_registry().add_chunks, tenant_id, indexed_chunks, indexed_embeddings, priority=PRIORITY_BULK
+                    )
+        
+        embedding_stats["chunks_reused"] += reused_chunks
+        print(f"Stored {chunk_index} chunks for document {document_id}, reused {reused_chunks} stored embeddings")
         
         # Update document status to completed
-        db.table('documents').update({
+        await run_in_threadpool(db.table('documents').update({
             "embedding_status": "completed", 
             "is_processed": 1
-        }).eq('id', document_id).execute()
+        }, returning='minimal').eq('id', document_id).execute)
+        
+        # Cached retrieval results no longer reflect the tenant's documents
+        get_retrieval_result_cache().bump_version(tenant_id)
         
         return True
     
     except Exception as e:
         print(f"Error processing document: {e}")
         # Update document status to failed
-        db.table('documents').update({
+        await run_in_threadpool(db.table('documents').update({
             "embedding_status": f"failed: {str(e)}"
-        }).eq('id', document_id).execute()
+        }, returning='minimal').eq('id', document_id).execute)
+        # Some chunks may have been stored before the failure
+        get_retrieval_result_cache().bump_version(tenant_id)
         return False
 
-async def retrieve_relevant_context(query: str, tenant_id: str, num_results: int = 5):
+async def reindex_document(document_id: str, file_path: str, document_type: str, tenant_id: str):
     """
-    Retrieve relevant document chunks based on the query.
-    Uses vector similarity search with FAISS if available, otherwise falls back to keyword matching.
+    Re-process a document that may already have chunks, changing only what differs.
+    
+    The file is chunked again and each chunk is matched to an existing embedded row by
+    content hash. Matching rows are kept (with their embedding) and only renumbered if
+    they moved; new chunks are embedded and inserted, and rows that no longer appear or
+    were stored without an embedding are deleted. All changes are written in a single transaction and the document's vectors
+    are swapped in the tenant's index in one step, so retrieval sees either the old or
+    the new version of the document, never both.
     """
     db = get_sqlite_client()
     
     try:
-        # First check if there are any processed documents for this tenant
-        docs_response = db.table('documents').select('*').eq('tenant_id', tenant_id).eq('is_processed', 1).execute()
+        await run_in_threadpool(db.table('documents').update({"embedding_status": "processing"}, returning='minimal').eq('id', document_id).execute)
         
-        if not docs_response.data:
-            return "No processed documents available for this tenant."
-        
-        # Clean and normalize the query
-        query = re.sub(r'\s+', ' ', query).lower().strip()
+        # Existing embedded rows by content hash; rows stored before chunks were hashed never
+        # match, and rows without an embedding are replaced so their chunks get embedded
+        with db.read_connection() as conn:
+            rows = conn.execute(
+                "SELECT id, chunk_index, content_hash, embedding IS NOT NULL AS embedded FROM document_chunks WHERE document_id = ?",
+                (document_id,)
+            ).fetchall()
+        existing = {}
+        unembedded = []
+        for row in rows:
+            if row['embedded']:
+                existing.setdefault(row['content_hash'], []).append(dict(row))
+            else:
+                unembedded.append((row['id'],))
         
-        # Get all document chunks for this tenant
-        chunks_response = db.table('document_chunks').select('*').eq('tenant_id', tenant_id).execute()
-        chunks = chunks_response.data
+        now = datetime.utcnow().isoformat()
+        kept = 0
+        renumbered = []  # (chunk_index, chunk ID)
+        inserted = []  # document_chunks rows
+        reused_chunks = 0
+        chunk_index = 0
         
-        if not chunks:
-            return "No document chunks available for this tenant."
-            
-        # Try vector similarity search if available
-        if vector_search_available:
-            # Check if we have embeddings in the chunks
-            valid_embeddings = []
-            valid_chunks = []
-            
-            for chunk in chunks:
-                if chunk.get('embedding'):
-                    try:
-                        # Parse the embedding JSON
-                        embedding = json.loads(chunk['embedding'])
-                        if embedding and len(embedding) > 0:
-                            valid_embeddings.append(embedding)
-                            valid_chunks.append(chunk)
-                    except (json.JSONDecodeError, TypeError) as e:
-                        print(f"Error parsing embedding for chunk {chunk['id']}: {e}")
-                        continue
+        with db.storage.from_("documents").open(file_path) as file:
+            chunks = iter_chunks(file, settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+            batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
             
-            if valid_embeddings and len(valid_embeddings) > 0:
-                print(f"Using FAISS search with {len(valid_embeddings)} embeddings")
-                # Generate query embedding
-                query_embedding = generate_embedding(query)
+            while True:
+                batch = list(islice(chunks, batch_size))
+                if not batch:
+                    break
                 
-                if query_embedding and len(query_embedding) > 0:
-                    # Use FAISS for efficient similarity search
-                    retriever = FAISSRetriever()
-                    retriever.fit(valid_chunks, valid_embeddings)
-                    top_chunks = retriever.search(query_embedding, num_results)
-                    
-                    if top_chunks and len(top_chunks) > 0:
-                        if not top_chunks:
-                            return "No relevant information found in the available documents."
-                        
-                        # Format the context
-                        context = "\n\n".join([chunk[0]['content'] for chunk in top_chunks])
-                        return context
+                new_chunks = []  # (chunk_index, content, content_hash)
+                for chunk in batch:
+                    content_hash = chunk_content_hash(chunk, EMBEDDING_MODEL_NAME)
+                    matches = existing.get(content_hash)
+                    if matches:
+                        row = matches.pop(0)
+                        kept += 1
+                        if row['chunk_index'] != chunk_index:
+                            renumbered.append((chunk_index, row['id']))
                     else:
-                        print("No FAISS results found, falling back to keyword matching")
-                else:
-                    print("Failed to generate query embedding, falling back to keyword matching")
-            else:
-                print("No valid embeddings found, falling back to keyword matching")
-        else:
-            print("Vector search not available, using keyword matching")
-            
-        # Fall back to keyword matching
-        stop_words = {'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'in', 'to', 'for'}
-        keywords = [word for word in query.split() if word not in stop_words]
+                        new_chunks.append((chunk_index, chunk, content_hash))
+                    chunk_index += 1
+                
+                if new_chunks:
+                    stored, reused = await _embed_chunk_batch(
+                        tenant_id,
+                        [chunk for _, chunk, _ in new_chunks],
+                        [content_hash for _, _, content_hash in new_chunks]
+                    )
+                    reused_chunks += reused
+                    for index, chunk, content_hash in new_chunks:
+                        inserted.append((str(uuid4()), document_id, tenant_id, chunk, index, stored.get(content_hash), content_hash, now))
+        
+        removed = [(row['id'],) for rows in existing.values() for row in rows] + unembedded
         
-        # Find relevant chunks that contain at least one keyword
-        relevant_chunks = []
+        # The transaction waits for the write lock, keep it off the event loop
+        await run_in_threadpool(_apply_chunk_diff, db, document_id, inserted, renumbered, removed)
         
-        for chunk in chunks:
-            chunk_content = chunk['content'].lower()
-            matching_keywords = [kw for kw in keywords if kw in chunk_content]
+        embedding_stats["chunks_reused"] += reused_chunks
+        print(f"Re-indexed document {document_id}: {kept} chunks kept ({len(renumbered)} renumbered), "
+              f"{len(inserted)} inserted, {len(removed)} deleted")
+        
+        if inserted or renumbered or removed:
+            await get_embedding_executor().run(_swap_document_vectors, tenant_id, document_id, priority=PRIORITY_BULK)
             
-            if matching_keywords:
-                # Calculate a simple relevance score based on number of keyword matches
-                score = len(matching_keywords)
-                relevant_chunks.append((chunk, score))
+            # Cached retrieval results no longer reflect the tenant's documents
+            get_retrieval_result_cache().bump_version(tenant_id)
+        
+        return True
+    
+    except Exception as e:
+        print(f"Error re-indexing document: {e}")
+        # The transaction was rolled back, so the previous chunks are still in place
+        await run_in_threadpool(db.table('documents').update({
+            "embedding_status": f"failed: {str(e)}"
+        }, returning='minimal').eq('id', document_id).execute)
+        return False
+
+def _swap_document_vectors(tenant_id: str, document_id: str):
+    """Replace a document's vectors in the tenant's cached index with its stored chunks. Blocking."""
+    db = get_sqlite_client()
+    with db.read_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, document_id, content, chunk_index, embedding FROM document_chunks "
+            "WHERE document_id = ? AND embedding IS NOT NULL ORDER BY chunk_index",
+            (document_id,)
+        ).fetchall()
+    indexed_chunks = []
+    indexed_embeddings = []
+    for row in rows:
+        chunk = dict(row)
+        indexed_embeddings.append(decode_embedding(chunk.pop('embedding')))
+        indexed_chunks.append(chunk)
+    get_index_registry().replace_document(tenant_id, document_id, indexed_chunks, indexed_embeddings)
+
+def _apply_chunk_diff(db, document_id: str, inserted: List[tuple], renumbered: List[tuple], removed: List[tuple]):
+    """Apply a document's chunk changes and mark it processed in one transaction. Blocking."""
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO document_chunks (id, document_id, tenant_id, content, chunk_index, embedding, content_hash, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            inserted
+        )
+        conn.executemany("UPDATE document_chunks SET chunk_index = ? WHERE id = ?", renumbered)
+        conn.executemany("DELETE FROM document_chunks WHERE id = ?", removed)
+        conn.execute(
+            "UPDATE documents SET embedding_status = 'completed', is_processed = 1 WHERE id = ?",
+            (document_id,)
+        )
+
+def get_tenant_retrieval_config(tenant_id: str) -> Dict[str, Any]:
+    """
+    Get per-tenant retrieval overrides from the "retrieval" key of the tenant's chat_widget_config.
+    Supported keys: index_type, nprobe, ef_search, mode, num_results, vector_weight,
+    keyword_weight, timeout_ms, context_token_budget.
+    """
+    db = get_sqlite_client()
+    tenant_response = db.table('tenants').select('chat_widget_config').eq('id', tenant_id).execute()
+    
+    if not tenant_response.data:
+        return {}
+        
+    config = tenant_response.data[0].get('chat_widget_config') or {}
+    if not isinstance(config, dict):
+        return {}
+    return config.get('retrieval') or {}
+
+def load_tenant_embeddings(tenant_id: str):
+    """
+    Load all embedded chunks stored for a tenant.
+    
+    Returns:
+        Tuple of (chunks, embeddings) in matching order
+    """
+    db = get_sqlite_client()
+    chunks_response = db.table('document_chunks').select('id, document_id, content, chunk_index, embedding').eq('tenant_id', tenant_id).execute()
+    
+    valid_embeddings = []
+    valid_chunks = []
+    
+    for chunk in chunks_response.data:
+        raw_embedding = chunk.pop('embedding', None)
+        if raw_embedding:
+            try:
+                # Decode the stored float32 BLOB (or legacy JSON text)
+                embedding = decode_embedding(raw_embedding)
+                if embedding is not None and len(embedding) > 0:
+                    valid_embeddings.append(embedding)
+                    valid_chunks.append(chunk)
+            except (ValueError, TypeError) as e:
+                print(f"Error decoding embedding for chunk {chunk['id']}: {e}")
+                continue
+    
+    return valid_chunks, valid_embeddings
+
+def load_chunk_embeddings(chunk_ids: List[str], full_precision_only: bool = True) -> Dict[str, Any]:
+    """
+    Load the embeddings of specific chunks.
+    
+    Args:
+        full_precision_only: Skip embeddings stored quantized instead of dequantizing them
+        
+    Returns:
+        Dictionary of chunk ID to float32 vector
+    """
+    if not chunk_ids:
+        return {}
+        
+    db = get_sqlite_client()
+    chunk_ids = list(chunk_ids)
+    rows = []
+    with db.read_connection() as conn:
+        # Batched to stay under SQLite's limit on bound variables
+        for offset in range(0, len(chunk_ids), READ_BACK_BATCH_SIZE):
+            batch = chunk_ids[offset:offset + READ_BACK_BATCH_SIZE]
+            placeholders = ', '.join(['?'] * len(batch))
+            rows.extend(conn.execute(f"SELECT id, embedding FROM document_chunks WHERE id IN ({placeholders})", batch).fetchall())
+    
+    vectors = {}
+    for row in rows:
+        if row['embedding'] is None:
+            continue
+        if not full_precision_only or is_full_precision(row['embedding']):
+            vectors[row['id']] = decode_embedding(row['embedding'])
+    return vectors
+
+def load_tenant_chunk_metadata(tenant_id: str) -> List[Dict[str, Any]]:
+    """
+    Load a tenant's embedded chunks without their embeddings, for use with an index opened from disk.
+    """
+    db = get_sqlite_client()
+    with db.read_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, document_id, content, chunk_index FROM document_chunks WHERE tenant_id = ? AND embedding IS NOT NULL",
+            (tenant_id,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def build_tenant_retriever(tenant_id: str) -> FAISSRetriever:
+    """
+    Build a FAISS retriever for a tenant.
+    Opens the tenant's saved index file when it matches the stored chunks, otherwise
+    builds the index from the stored embeddings and saves it for the next worker.
+    """
+    config = get_tenant_retrieval_config(tenant_id)
+    retriever = FAISSRetriever(
+        index_type=config.get('index_type'),
+        nprobe=config.get('nprobe'),
+        ef_search=config.get('ef_search')
+    )
+    retriever.vector_loader = load_chunk_embeddings
+    
+    if settings.VECTOR_INDEX_PERSIST and retriever.available:
+        chunks = load_tenant_chunk_metadata(tenant_id)
+        version = index_version([chunk['id'] for chunk in chunks], retriever.requested_index_type)
+        if retriever.load(index_file_path(tenant_id, version), chunks):
+            return retriever
+    
+    chunks, embeddings = load_tenant_embeddings(tenant_id)
+    retriever.fit(chunks, embeddings)
+    
+    if settings.VECTOR_INDEX_PERSIST and retriever.available and chunks:
+        version = index_version([chunk['id'] for chunk in chunks], retriever.requested_index_type)
+        retriever.persist_path = index_file_path(tenant_id, version)
+        retriever.save()
+        remove_stale_index_files(tenant_id, version)
+    
+    return retriever
+
+def get_query_embedding(query: str):
+    """
+    Embed a normalized query, reusing the embedding of a previously seen query.
+    Blocking, meant to run on the embedding executor.
+    """
+    query_cache = get_query_embedding_cache()
+    query_embedding = query_cache.get(EMBEDDING_MODEL_NAME, query)
+    
+    if query_embedding is None:
+        query_embedding = generate_embedding(query)
+        query_cache.put(EMBEDDING_MODEL_NAME, query, query_embedding)
+    return query_embedding
+
+def vector_search(query: str, tenant_id: str, num_results: int = 5):
+    """
+    Find the chunks closest to the query in the tenant's vector index.
+    Blocking, meant to run on the embedding executor.
+    
+    Returns:
+        List of (chunk, distance) tuples, empty if vector search could not be used
+    """
+    # Reuse the tenant's cached index, building it on first use
+    retriever = get_index_registry().get(tenant_id, lambda: build_tenant_retriever(tenant_id))
+    
+    if retriever.index is None or retriever.index.ntotal == 0:
+        print("No valid embeddings found, falling back to keyword matching")
+        return []
+        
+    print(f"Using FAISS search with {retriever.index.ntotal} embeddings")
+    query_embedding = get_query_embedding(query)
+    
+    if len(query_embedding) == 0:
+        print("Failed to generate query embedding, falling back to keyword matching")
+        return []
+        
+    top_chunks = retriever.search(query_embedding, num_results)
+    
+    if not top_chunks:
+        print("No FAISS results found, falling back to keyword matching")
+    return top_chunks
+
+def reciprocal_rank_fusion(result_lists: List[List[Any]], weights: List[float], k: int = 60) -> List[Any]:
+    """
+    Merge ranked result lists with weighted reciprocal rank fusion.
+    A chunk scores weight / (k + rank) in every list it appears in, so only ranks
+    are combined and the incompatible distance and BM25 scales never mix.
+    
+    Args:
+        result_lists: Lists of (chunk, score) tuples, each ordered best first
+        weights: One weight per list
+        k: Damping constant, larger values flatten the advantage of top ranks
+        
+    Returns:
+        List of (chunk, fused score) tuples, highest score first
+    """
+    fused = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, (chunk, _) in enumerate(results, start=1):
+            entry = fused.setdefault(chunk['id'], [chunk, 0.0])
+            entry[1] += weight / (k + rank)
+    
+    return sorted(((chunk, score) for chunk, score in fused.values()), key=lambda x: x[1], reverse=True)
+
+async def _run_retrieval_leg(name: str, awaitable, timeout: float):
+    """Await one retrieval leg, returning None if it fails or exceeds the timeout"""
+    start = time.perf_counter()
+    try:
+        results = await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        print(f"{name} search exceeded {timeout * 1000:.0f} ms, continuing without it")
+        return None
+    except Exception as e:
+        print(f"{name} search failed: {e}")
+        return None
+    
+    print(f"{name} search returned {len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return results
+
+async def hybrid_search(query: str, tenant_id: str, num_results: int, config: Dict[str, Any]):
+    """
+    Run vector and keyword search concurrently and fuse their rankings.
+    
+    Each leg gets the same latency budget; a leg that is slow, fails or has a zero
+    weight is left out and the other leg's ranking is used on its own.
+    
+    Args:
+        config: Tenant retrieval overrides (vector_weight, keyword_weight, timeout_ms)
+        
+    Returns:
+        Tuple of (list of (chunk, fused score) tuples best first, whether every leg
+        with a non-zero weight completed)
+    """
+    vector_weight = float(config.get('vector_weight', settings.RETRIEVAL_VECTOR_WEIGHT))
+    keyword_weight = float(config.get('keyword_weight', settings.RETRIEVAL_KEYWORD_WEIGHT))
+    timeout = float(config.get('timeout_ms', settings.RETRIEVAL_TIMEOUT_MS)) / 1000
+    candidates = max(num_results, settings.RETRIEVAL_CANDIDATES)
+    
+    # Vector search is left out until the embedding model has loaded
+    complete = vector_search_available or vector_weight <= 0
+    if not vector_search_available:
+        vector_weight = 0.0
+    
+    legs = []
+    weights = []
+    if vector_weight > 0:
+        # Index lookup, query encoding and search are CPU-bound, keep them off the event loop
+        legs.append(_run_retrieval_leg("Vector", get_embedding_executor().run(vector_search, query, tenant_id, candidates), timeout))
+        weights.append(vector_weight)
+    if keyword_weight > 0:
+        # The full-text query is I/O-bound, so it runs on the default thread pool
+        loop = asyncio.get_running_loop()
+        legs.append(_run_retrieval_leg("Keyword", loop.run_in_executor(None, keyword_search, query, tenant_id, candidates), timeout))
+        weights.append(keyword_weight)
+    
+    if not legs:
+        return [], complete
+    
+    result_lists = await asyncio.gather(*legs)
+    complete = complete and all(results is not None for results in result_lists)
+    result_lists = [results or [] for results in result_lists]
+    return reciprocal_rank_fusion(result_lists, weights, settings.RETRIEVAL_RRF_K)[:num_results], complete
+
+async def retrieve_relevant_context(query: str, tenant_id: str, num_results: Optional[int] = None):
+    """
+    Retrieve relevant document chunks based on the query.
+    
+    In hybrid mode (the default) vector and keyword search run concurrently and their
+    results are fused. In vector mode keyword matching is only a fallback, and keyword
+    mode skips vector search entirely. The mode and result count can be overridden
+    per tenant in the "retrieval" key of chat_widget_config.
+    
+    Results are cached per tenant and retrieval config until the tenant's documents change
+    or the entry expires, and concurrent identical requests share one retrieval. Results
+    retrieved without vector search, because the model was still loading or a search leg
+    failed or timed out, are not cached.
+    """
+    config = get_tenant_retrieval_config(tenant_id)
+    
+    # Repeated questions against an unchanged corpus skip the database and search entirely
+    result_cache = get_retrieval_result_cache()
+    cache_key = result_cache.make_key(tenant_id, query, num_results, config)
+    cached_context = result_cache.get(cache_key)
+    if cached_context is not None:
+        return cached_context
+    
+    # The cache key holds the tenant, corpus version, config and normalized query, so it also identifies identical work
+    return await get_retrieval_flights().do(
+        cache_key,
+        lambda: _retrieve_context(query, tenant_id, num_results, config, cache_key)
+    )
+
+async def _retrieve_context(query: str, tenant_id: str, num_results: Optional[int], config: Dict[str, Any], cache_key):
+    """Run retrieval for retrieve_relevant_context and cache the resulting context if it is complete"""
+    result_cache = get_retrieval_result_cache()
+    db = get_sqlite_client()
+    
+    try:
+        # First check if there are any processed documents for this tenant
+        docs_response = db.table('documents').select('id').eq('tenant_id', tenant_id).eq('is_processed', 1).execute()
         
-        # Sort by relevance score
-        relevant_chunks.sort(key=lambda x: x[1], reverse=True)
+        if not docs_response.data:
+            context = "No processed documents available for this tenant."
+            result_cache.put(cache_key, context)
+            return context
+        
+        # Clean and normalize the query
+        query = re.sub(r'\s+', ' ', query).lower().strip()
+        
+        mode = config.get('mode') or settings.RETRIEVAL_MODE
+        if num_results is None:
+            num_results = int(config.get('num_results') or settings.RETRIEVAL_NUM_RESULTS)
+        # Fetch extra candidates so chunks dropped as duplicates can be replaced
+        candidates = num_results * max(1, settings.CONTEXT_CANDIDATE_FACTOR)
         
-        # Get top results
-        top_chunks = relevant_chunks[:num_results]
+        complete = True
+        if mode == 'hybrid':
+            top_chunks, complete = await hybrid_search(query, tenant_id, candidates, config)
+        else:
+            top_chunks = []
+            # Try vector similarity search if available
+            if mode != 'keyword' and vector_search_available:
+                top_chunks = await get_embedding_executor().run(vector_search, query, tenant_id, candidates)
+            elif mode != 'keyword':
+                print("Vector search not available, using keyword matching")
+                complete = False
+            
+            if not top_chunks:
+                # Fall back to keyword matching, ranked with BM25 by the full-text index
+                top_chunks = keyword_search(query, tenant_id, candidates)
         
         if not top_chunks:
-            return "No relevant information found in the available documents."
+            context = "No relevant information found in the available documents."
+        else:
+            # Pack the best chunks into the token budget, skipping near-duplicates
+            vectors = load_chunk_embeddings([chunk['id'] for chunk, _ in top_chunks], full_precision_only=False) \
+                if vector_search_available else None
+            token_budget = int(config.get('context_token_budget') or settings.CONTEXT_TOKEN_BUDGET)
+            packed = pack_context(top_chunks, token_budget, num_results, vectors, settings.CONTEXT_DEDUP_SIMILARITY)
+            print(f"Packed {len(packed)} of {len(top_chunks)} retrieved chunks into the context")
+            context = "\n\n".join(packed)
         
-        # Format the context
-        context = "\n\n".join([chunk[0]['content'] for chunk in top_chunks])
+        if complete:
+            result_cache.put(cache_key, context)
         return context
         
     except Exception as e:
         print(f"Error retrieving document context: {e}")
         return "Error retrieving document context."
 
-async def process_chat_message(user_message: str, conversation_history: List[Dict[str, Any]], tenant_id: str, session_id: str):
+async def _prepare_chat_request(user_message: str, conversation_history: List[Dict[str, Any]], tenant_id: str, conversation_summary: Optional[str] = None) -> Dict[str, Any]:
     """
-    Process a chat message using the LLM and retrieve relevant context from documents.
+    Retrieve context and build the LLM messages for a chat turn.
+    The history is trimmed to the newest messages that fit in HISTORY_TOKEN_BUDGET,
+    preceded by the rolling summary of earlier turns when there is one.
+    
+    Returns:
+        Dictionary with the tenant, context and messages, plus a cached_answer when the
+        semantic response cache already has one (query_embedding and context_hash are
+        set when a generated answer should be stored in that cache)
     """
     # Get tenant information
     db = get_sqlite_client()
@@ -374,6 +1332,24 @@ async def process_chat_message(user_message: str, conversation_history: List[Dic
     # Retrieve relevant context from documents
     context = await retrieve_relevant_context(user_message, tenant_id)
     
+    # Opening questions may be answered from the tenant's semantic response cache, if enabled
+    response_cache = get_semantic_response_cache()
+    cache_settings = tenant_response_cache_settings(tenant.get('chat_widget_config'))
+    query_embedding = None
+    context_hash = None
+    
+    if cache_settings and vector_search_available and is_first_turn(conversation_history):
+        normalized_message = re.sub(r'\s+', ' ', user_message).lower().strip()
+        query_embedding = await get_embedding_executor().run(get_query_embedding, normalized_message)
+        
+        if len(query_embedding) > 0:
+            context_hash = hash_context(context)
+            cached_answer = response_cache.lookup(tenant_id, query_embedding, context_hash, cache_settings['similarity_threshold'])
+            if cached_answer is not None:
+                return {"tenant": tenant, "context": context, "messages": None, "cached_answer": cached_answer}
+        else:
+            query_embedding = None
+    
     # Format conversation history
     messages = []
     
@@ -405,8 +1381,15 @@ async def process_chat_message(user_message: str, conversation_history: List[Dic
 
     messages.append(system_message)
     
+    # Earlier turns are represented by their rolling summary
+    if conversation_summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation with this customer:\n{conversation_summary}"
+        })
+    
     # Add conversation history
-    for msg in conversation_history:
+    for msg in fit_history_to_budget(conversation_history, settings.HISTORY_TOKEN_BUDGET):
         messages.append({
             "role": msg["role"],
             "content": msg["content"]
@@ -418,35 +1401,52 @@ async def process_chat_message(user_message: str, conversation_history: List[Dic
         "content": user_message
     })
     
+    return {
+        "tenant": tenant,
+        "context": context,
+        "messages": messages,
+        "cached_answer": None,
+        "query_embedding": query_embedding,
+        "context_hash": context_hash,
+    }
+
+def _llm_api_key_configured() -> bool:
+    """Whether a usable LLM API key is configured, otherwise demo responses are served"""
+    return bool(settings.MCP_API_KEY) and not settings.MCP_API_KEY.startswith("your_")
+
+async def process_chat_message(user_message: str, conversation_history: List[Dict[str, Any]], tenant_id: str, session_id: str, conversation_summary: Optional[str] = None):
+    """
+    Process a chat message using the LLM and retrieve relevant context from documents.
+    
+    Args:
+        conversation_history: Recent messages before this one, oldest first
+        conversation_summary: Rolling summary of turns older than conversation_history
+    """
+    chat = await _prepare_chat_request(user_message, conversation_history, tenant_id, conversation_summary)
+    if chat["cached_answer"] is not None:
+        return chat["cached_answer"]
+    
+    tenant = chat["tenant"]
+    context = chat["context"]
+    messages = chat["messages"]
+    
     # Call the LLM API (assumed to be OpenAI compatible)
     try:
         # For demo purposes, check if we have a valid API key
-        if not settings.MCP_API_KEY or settings.MCP_API_KEY.startswith("your_") or settings.MCP_API_KEY == "":
+        if not _llm_api_key_configured():
             # If no valid API key, generate a demo response
             return generate_demo_response(user_message, tenant['name'], context)
-            
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {settings.MCP_API_KEY}"
-                },
-                json={
-                    "model": "gpt-4.1-nano-2025-04-14",
-                    "messages": messages,
-                    "temperature": 0.7,
-                    "max_tokens": 1000,
-                }
-            )
-            
-            response_data = response.json()
-            
-            if "choices" in response_data and len(response_data["choices"]) > 0:
-                assistant_message = response_data["choices"][0]["message"]["content"]
-                return assistant_message
-            else:
-                raise ValueError("Invalid response from LLM API")
+        
+        if settings.SINGLE_FLIGHT_COMPLETIONS and is_first_turn(conversation_history):
+            # Sessions opening with the same question at the same time share one completion
+            flight_key = (tenant_id, hashlib.sha1(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest())
+            assistant_message = await get_completion_flights().do(flight_key, lambda: _request_completion(messages))
+        else:
+            assistant_message = await _request_completion(messages)
+        
+        if chat["query_embedding"] is not None:
+            get_semantic_response_cache().store(tenant_id, chat["query_embedding"], chat["context_hash"], assistant_message)
+        return assistant_message
     
     except Exception as e:
         print(f"Error in LLM API call: {e}")
@@ -455,6 +1455,106 @@ async def process_chat_message(user_message: str, conversation_history: List[Dic
         # For demo purposes, return a fallback response
         return generate_demo_response(user_message, tenant['name'], context)
 
+async def _request_completion(messages: List[Dict[str, str]], max_tokens: int = 1000) -> str:
+    """Send a chat completion request and return the assistant's answer"""
+    # Reuse pooled keep-alive connections to the LLM API
+    response = await get_llm_http_client().post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {settings.MCP_API_KEY}"
+        },
+        json={
+            "model": "gpt-4.1-nano-2025-04-14",
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": max_tokens,
+        }
+    )
+    
+    response_data = response.json()
+    
+    if "choices" in response_data and len(response_data["choices"]) > 0:
+        return response_data["choices"][0]["message"]["content"]
+    else:
+        raise ValueError("Invalid response from LLM API")
+
+async def stream_chat_message(user_message: str, conversation_history: List[Dict[str, Any]], tenant_id: str, session_id: str, conversation_summary: Optional[str] = None):
+    """
+    Streaming variant of process_chat_message.
+    Calls the LLM with stream enabled and yields the answer's text pieces as they arrive.
+    
+    If the request fails before any text was received, the demo response is yielded
+    instead, as process_chat_message does. A failure mid-answer, including a stream that
+    ends without its final "[DONE]" event, is raised so the caller doesn't treat the
+    partial answer as complete.
+    """
+    chat = await _prepare_chat_request(user_message, conversation_history, tenant_id, conversation_summary)
+    if chat["cached_answer"] is not None:
+        yield chat["cached_answer"]
+        return
+    
+    tenant = chat["tenant"]
+    context = chat["context"]
+    
+    if not _llm_api_key_configured():
+        yield generate_demo_response(user_message, tenant['name'], context)
+        return
+    
+    pieces = []
+    finished = False
+    try:
+        async with get_llm_http_client().stream(
+            "POST",
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {settings.MCP_API_KEY}"
+            },
+            json={
+                "model": "gpt-4.1-nano-2025-04-14",
+                "messages": chat["messages"],
+                "temperature": 0.7,
+                "max_tokens": 1000,
+                "stream": True,
+            }
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise ValueError(f"LLM API returned status {response.status_code}: {response.text[:200]}")
+            
+            # The API sends server-sent events: "data: {json chunk}" lines, ending with "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    finished = True
+                    break
+                
+                choices = json.loads(data).get("choices") or []
+                piece = choices[0].get("delta", {}).get("content") if choices else None
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+    
+    except Exception as e:
+        print(f"Error in streaming LLM API call: {e}")
+        if pieces:
+            raise
+        yield generate_demo_response(user_message, tenant['name'], context)
+        return
+    
+    if not pieces:
+        yield generate_demo_response(user_message, tenant['name'], context)
+        return
+    
+    if not finished:
+        raise ValueError("LLM stream ended before the answer was complete")
+    
+    if chat["query_embedding"] is not None:
+        get_semantic_response_cache().store(tenant_id, chat["query_embedding"], chat["context_hash"], "".join(pieces))
+
 def generate_demo_response(user_message: str, tenant_name: str, context: str) -> str:
     """
     Generate a demo response when LLM API is not available.
@@ -0,0 +1,117 @@
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.vector_codec import encode_embedding, decode_embedding
+
+class QueryEmbeddingCache:
+    """
+    Size-bounded LRU cache of query embeddings.
+
+    Keys are the embedding model name plus the normalized query text, so switching
+    models never serves stale vectors. When a persist path is configured the cache
+    is loaded at startup and written back on shutdown.
+    """
+
+    def __init__(self, max_entries: int, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, query: str):
+        """Return the cached embedding for a query, or None"""
+        key = (model_name, query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model_name: str, query: str, embedding):
+        """Store a query embedding, evicting the least recently used entries"""
+        if self.max_entries <= 0 or embedding is None or len(embedding) == 0:
+            return
+        key = (model_name, query)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persist_path": self.persist_path,
+            }
+
+    def load(self):
+        """Load persisted entries from disk, if persistence is enabled"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with open(self.persist_path, 'r') as f:
+                records = json.load(f)
+
+            with self._lock:
+                # Records are stored oldest first, so replaying them restores LRU order
+                for record in records[-self.max_entries:]:
+                    embedding = decode_embedding(base64.b64decode(record["embedding"]))
+                    self._entries[(record["model"], record["query"])] = embedding
+            print(f"Loaded {len(self._entries)} cached query embeddings from {self.persist_path}")
+        except Exception as e:
+            print(f"Error loading query embedding cache: {e}")
+
+    def save(self):
+        """Write the cache to disk, if persistence is enabled"""
+        if not self.persist_path:
+            return
+
+        try:
+            with self._lock:
+                records = [
+                    {
+                        "model": model_name,
+                        "query": query,
+                        "embedding": base64.b64encode(encode_embedding(embedding)).decode('ascii')
+                    }
+                    for (model_name, query), embedding in self._entries.items()
+                ]
+
+            # Write to a temporary file first so a crash never leaves a truncated cache
+            os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.persist_path)
+            print(f"Saved {len(records)} cached query embeddings to {self.persist_path}")
+        except Exception as e:
+            print(f"Error saving query embedding cache: {e}")
+
+# Create the shared cache instance
+query_embedding_cache = QueryEmbeddingCache(
+    settings.QUERY_EMBEDDING_CACHE_SIZE,
+    settings.QUERY_EMBEDDING_CACHE_PATH or None
+)
+
+def get_query_embedding_cache():
+    """Get the shared query embedding cache"""
+    return query_embedding_cache
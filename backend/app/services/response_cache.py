@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services.result_cache import get_retrieval_result_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def hash_context(context: str) -> str:
+    """Fingerprint a retrieved context string"""
+    return hashlib.sha1(context.encode('utf-8')).hexdigest()
+
+def is_first_turn(conversation_history) -> bool:
+    """Whether the assistant has not answered anything in this conversation yet"""
+    return not any(msg.get('role') == 'assistant' for msg in conversation_history)
+
+def tenant_response_cache_settings(chat_widget_config) -> Optional[Dict[str, Any]]:
+    """
+    Read a tenant's response cache settings from the "response_cache" key of its chat_widget_config.
+    Supported keys: enabled, similarity_threshold.
+
+    Returns:
+        The settings with defaults applied, or None if the tenant has not opted in
+    """
+    if not isinstance(chat_widget_config, dict):
+        return None
+    config = chat_widget_config.get('response_cache') or {}
+    if not isinstance(config, dict) or not config.get('enabled'):
+        return None
+    return {
+        "similarity_threshold": float(config.get('similarity_threshold', settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD)),
+    }
+
+class SemanticResponseCache:
+    """
+    Per-tenant cache of generated assistant answers to opening questions.
+
+    A cached answer is reused when a new question's embedding has a cosine similarity
+    of at least the threshold with a cached question, the context retrieved for it is
+    identical, and the tenant's corpus version has not changed since the answer was
+    generated. Each tenant keeps at most max_entries answers in LRU order, and
+    entries expire after the TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._tenants: Dict[str, "OrderedDict[int, Dict[str, Any]]"] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, tenant_id: str, embedding, context_hash: str, similarity_threshold: float) -> Optional[str]:
+        """
+        Find a cached answer for a semantically equivalent question.
+
+        Args:
+            embedding: Embedding of the new question
+            context_hash: hash_context() of the context retrieved for the new question
+            similarity_threshold: Minimum cosine similarity to count as the same question
+
+        Returns:
+            The cached answer, or None
+        """
+        query = _unit(embedding)
+        version = get_retrieval_result_cache().corpus_version(tenant_id)
+
+        with self._lock:
+            entries = self._tenants.get(tenant_id)
+            if not entries:
+                self.misses += 1
+                return None
+
+            self._drop_stale(entries, version)
+
+            best_id = None
+            best_similarity = similarity_threshold
+            for entry_id, entry in entries.items():
+                if entry['context_hash'] != context_hash:
+                    continue
+                similarity = float(np.dot(entry['embedding'], query))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            entries.move_to_end(best_id)
+            self.hits += 1
+            print(f"Semantic response cache hit for tenant {tenant_id} (similarity {best_similarity:.3f})")
+            return entries[best_id]['answer']
+
+    def store(self, tenant_id: str, embedding, context_hash: str, answer: str):
+        """Cache a generated answer for a question"""
+        if self.max_entries <= 0 or not answer:
+            return
+        entry = {
+            "embedding": _unit(embedding),
+            "context_hash": context_hash,
+            "answer": answer,
+            "corpus_version": get_retrieval_result_cache().corpus_version(tenant_id),
+            "stored_at": time.monotonic(),
+        }
+
+        with self._lock:
+            entries = self._tenants.setdefault(tenant_id, OrderedDict())
+            entries[next(self._ids)] = entry
+            self.stores += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tenants": len(self._tenants),
+                "entries": sum(len(entries) for entries in self._tenants.values()),
+                "max_entries_per_tenant": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop_stale(self, entries, version: int):
+        """Remove entries that expired or were generated against an older corpus"""
+        now = time.monotonic()
+        stale_ids = [
+            entry_id for entry_id, entry in entries.items()
+            if entry['corpus_version'] != version or now - entry['stored_at'] > self.ttl_seconds
+        ]
+        for entry_id in stale_ids:
+            del entries[entry_id]
+        if stale_ids:
+            self.invalidations += len(stale_ids)
+
+def _unit(embedding):
+    """Return an embedding as a unit-length float32 vector"""
+    vector = np.asarray(embedding, dtype='float32')
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+# Create the shared cache instance
+semantic_response_cache = SemanticResponseCache(
+    settings.RESPONSE_CACHE_MAX_ENTRIES,
+    settings.RESPONSE_CACHE_TTL_SECONDS
+)
+
+def get_semantic_response_cache():
+    """Get the shared semantic response cache"""
+    return semantic_response_cache
@@ -0,0 +1,120 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and drop punctuation and extra whitespace, so near-identical questions share a key"""
+    query = re.sub(r'[^\w\s]', ' ', query.lower())
+    return re.sub(r'\s+', ' ', query).strip()
+
+class RetrievalResultCache:
+    """
+    Size- and TTL-bounded LRU cache of retrieved context strings.
+
+    Keys combine the tenant, the tenant's corpus version, the normalized query, the
+    requested result count and the tenant's retrieval config. Any change to a tenant's documents bumps its corpus
+    version, so cached results never outlive the chunks they were built from.
+    Versions are tracked per process; the TTL bounds how long another worker can
+    serve results from before a change it did not see.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, int, str, Optional[int], str], Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_key(self, tenant_id: str, query: str, num_results: Optional[int] = None, config: Optional[Dict[str, Any]] = None):
+        """
+        Build a cache key against the tenant's current corpus version.
+
+        Args:
+            config: Tenant retrieval overrides the result depends on (mode, weights, budgets)
+        """
+        with self._lock:
+            version = self._versions.get(tenant_id, 0)
+        return (tenant_id, version, normalize_query(query), num_results, json.dumps(config or {}, sort_keys=True))
+
+    def get(self, key):
+        """Return the cached result for a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        """
+        Store a result under a key from make_key().
+        Results computed against a corpus version that has since been bumped are dropped.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if key[1] != self._versions.get(key[0], 0):
+                return
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bump_version(self, tenant_id: str):
+        """Mark a tenant's corpus as changed and drop its cached results"""
+        with self._lock:
+            self._versions[tenant_id] = self._versions.get(tenant_id, 0) + 1
+            stale_keys = [key for key in self._entries if key[0] == tenant_id]
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def corpus_version(self, tenant_id: str) -> int:
+        """Current corpus version of a tenant in this process"""
+        with self._lock:
+            return self._versions.get(tenant_id, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+# Create the shared cache instance
+retrieval_result_cache = RetrievalResultCache(
+    settings.RETRIEVAL_CACHE_SIZE,
+    settings.RETRIEVAL_CACHE_TTL_SECONDS
+)
+
+def get_retrieval_result_cache():
+    """Get the shared retrieval result cache"""
+    return retrieval_result_cache
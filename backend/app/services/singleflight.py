@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async computations.
+
+    The first caller for a key starts the computation; callers that arrive with the
+    same key while it is still running wait for that result instead of starting their
+    own. The computation runs as its own task, so a caller that disconnects does not
+    cancel it for the others. Nothing is cached once the computation finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+        # Counters
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        """
+        Return the result of fn(), sharing it with concurrent callers of the same key.
+
+        Args:
+            key: Identifies identical work, e.g. tenant plus normalized input
+            fn: Coroutine function that performs the work
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters for monitoring"""
+        calls = self.started + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / calls if calls else 0.0,
+        }
+
+# Shared instances for the chat path
+retrieval_flights = SingleFlight("retrieval")
+completion_flights = SingleFlight("completion")
+
+def get_retrieval_flights():
+    """Get the single-flight group for context retrieval"""
+    return retrieval_flights
+
+def get_completion_flights():
+    """Get the single-flight group for first-turn LLM completions"""
+    return completion_flights
@@ -0,0 +1,71 @@
+from typing import Dict, List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Encoding used by the gpt-4.1 model family
+TOKEN_ENCODING_NAME = 'o200k_base'
+# Without the tokenizer, tokens are estimated from the UTF-8 size of the text. English averages
+# about 4 bytes per token, but code, digits and non-Latin scripts get much closer to 3 (CJK
+# characters take 3 bytes and about one token each), so 3 overestimates rather than letting
+# prompts outgrow the model's context window.
+BYTES_PER_TOKEN = 3
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """Load the tokenizer once; None when tiktoken or its encoding files are unavailable"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is None:
+            print("tiktoken is not installed, estimating token counts conservatively")
+        else:
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING_NAME)
+            except Exception as e:
+                print(f"Could not load tokenizer {TOKEN_ENCODING_NAME}, estimating token counts conservatively: {e}")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in a text, or estimate them from its UTF-8 size without tiktoken"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text.encode('utf-8')) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Count the tokens of chat messages, including the per-message overhead"""
+    return sum(count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """
+    Cut a text down to at most max_tokens tokens.
+
+    Args:
+        keep_end: Keep the end of the text instead of the beginning
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return encoding.decode(tokens)
+
+    data = text.encode('utf-8')
+    max_bytes = max_tokens * BYTES_PER_TOKEN
+    if len(data) <= max_bytes:
+        return text
+    # A character cut at the boundary is dropped
+    data = data[-max_bytes:] if keep_end else data[:max_bytes]
+    return data.decode('utf-8', errors='ignore')
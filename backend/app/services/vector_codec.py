@@ -0,0 +1,101 @@
+import json
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Every stored embedding starts with a small header followed by the packed vector:
+#   version (uint8) | dtype code (uint8) | dimension (uint16), all little-endian.
+# The header is 4 bytes long, so the float32 payload stays 4-byte aligned for np.frombuffer.
+HEADER = struct.Struct('<BBH')
+FORMAT_VERSION = 1
+
+DTYPE_FLOAT32 = 1
+# Scalar-quantized: a float32 scale followed by one int8 per dimension (value = code * scale)
+DTYPE_INT8 = 2
+
+SCALE = struct.Struct('<f')
+
+def encode_embedding(embedding, dtype: str = 'float32') -> bytes:
+    """
+    Pack an embedding vector into a little-endian BLOB with a header.
+
+    Args:
+        embedding: List of floats or a 1-D numpy array
+        dtype: 'float32' for full precision, or 'int8' to store a scalar-quantized
+            vector at a quarter of the size
+    """
+    if dtype == 'int8' and np is not None:
+        values = np.asarray(embedding, dtype='float32')
+        max_abs = float(np.abs(values).max()) if len(values) else 0.0
+        scale = max_abs / 127 if max_abs > 0 else 1.0
+        codes = np.clip(np.rint(values / scale), -127, 127).astype('int8')
+        return HEADER.pack(FORMAT_VERSION, DTYPE_INT8, len(codes)) + SCALE.pack(scale) + codes.tobytes()
+
+    if np is not None:
+        payload = np.asarray(embedding, dtype='<f4').tobytes()
+        dimension = len(payload) // 4
+    else:
+        values = array('f', embedding)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        payload = values.tobytes()
+        dimension = len(values)
+
+    return HEADER.pack(FORMAT_VERSION, DTYPE_FLOAT32, dimension) + payload
+
+def decode_embedding(value):
+    """
+    Decode a stored embedding into a float32 vector.
+
+    Float32 BLOBs are decoded with np.frombuffer, which returns a read-only view over
+    the row's bytes instead of copying them. Int8 BLOBs are dequantized into a new
+    array. Legacy rows that still hold JSON text are parsed the old way so retrieval
+    keeps working before the migration has run.
+
+    Returns:
+        A 1-D float32 numpy array (a list when numpy is unavailable), or None
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        values = json.loads(value)
+        if not values:
+            return None
+        return np.asarray(values, dtype='float32') if np is not None else values
+
+    try:
+        version, dtype_code, dimension = HEADER.unpack_from(value)
+    except struct.error as e:
+        raise ValueError(f"Malformed embedding BLOB: {e}")
+    if version != FORMAT_VERSION or dtype_code not in (DTYPE_FLOAT32, DTYPE_INT8):
+        raise ValueError(f"Unsupported embedding format (version {version}, dtype {dtype_code})")
+
+    if dtype_code == DTYPE_INT8:
+        (scale,) = SCALE.unpack_from(value, HEADER.size)
+        offset = HEADER.size + SCALE.size
+        if np is not None:
+            return np.frombuffer(value, dtype='int8', count=dimension, offset=offset).astype('float32') * np.float32(scale)
+        return [code * scale for code in struct.unpack_from(f'<{dimension}b', value, offset)]
+
+    if np is not None:
+        return np.frombuffer(value, dtype='<f4', count=dimension, offset=HEADER.size)
+
+    values = array('f')
+    values.frombytes(bytes(value[HEADER.size:HEADER.size + dimension * 4]))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tolist()
+
+def is_full_precision(value) -> bool:
+    """Whether a stored embedding holds the original float32 values"""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return True
+    return len(value) >= HEADER.size and HEADER.unpack_from(value)[1] == DTYPE_FLOAT32
@@ -0,0 +1,263 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.db.sqlite_db import get_sqlite_client
+
+class TenantIndexRegistry:
+    """
+    Long-lived, per-tenant cache of built vector retrievers.
+
+    Retrievers are kept in memory between chat messages and updated in place
+    when documents are added or removed. Cold tenants are evicted in LRU order
+    once the combined index size exceeds the configured memory budget.
+
+    Each worker process has its own registry, and documents may be changed by
+    another worker. So a cached retriever is compared with a fingerprint of the
+    tenant's stored chunks at most every VECTOR_INDEX_FRESHNESS_CHECK_SECONDS,
+    and rebuilt if they no longer match.
+    """
+
+    def __init__(self, memory_budget_bytes: int):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        # Bumped whenever a tenant's corpus changes while it is not cached, so a
+        # build that started before the change is not stored afterwards
+        self._generations: Dict[str, int] = {}
+        # Chunk fingerprint each cached retriever matches, and when it was last checked
+        self._fingerprints: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        self._lock = threading.RLock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.builds = 0
+        self.evictions = 0
+        self.build_time_total = 0.0
+        self.last_build_time = 0.0
+
+    def get(self, tenant_id: str, builder: Callable[[], Any]):
+        """
+        Return the cached retriever for a tenant, building it on a miss.
+
+        Args:
+            tenant_id: Tenant whose retriever is requested
+            builder: Callable that builds a fresh retriever from the database
+        """
+        with self._lock:
+            retriever = self._entries.get(tenant_id)
+            checked = self._fingerprints.get(tenant_id)
+            
+        if retriever is not None and checked is not None and \
+                time.monotonic() - checked[1] >= settings.VECTOR_INDEX_FRESHNESS_CHECK_SECONDS:
+            # Queried outside the lock so other tenants are not blocked
+            fingerprint = tenant_chunk_fingerprint(tenant_id)
+            with self._lock:
+                if self._entries.get(tenant_id) is retriever:
+                    if fingerprint == checked[0]:
+                        self._fingerprints[tenant_id] = (fingerprint, time.monotonic())
+                    else:
+                        # Another worker changed the tenant's documents
+                        print(f"Vector index for tenant {tenant_id} is out of date, rebuilding it")
+                        self.stale += 1
+                        self.invalidate(tenant_id)
+                        
+        with self._lock:
+            retriever = self._entries.get(tenant_id)
+            if retriever is not None:
+                self._entries.move_to_end(tenant_id)
+                self.hits += 1
+                return retriever
+            self.misses += 1
+            generation = self._generations.get(tenant_id, 0)
+
+        # Taken before the build, so changes stored while it runs are detected later
+        fingerprint = tenant_chunk_fingerprint(tenant_id)
+        
+        # Build outside the lock so other tenants are not blocked
+        start = time.perf_counter()
+        retriever = builder()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.builds += 1
+            self.build_time_total += elapsed
+            self.last_build_time = elapsed
+
+            if self._generations.get(tenant_id, 0) != generation:
+                # The corpus changed during the build, serve it once but don't cache it
+                return retriever
+
+            # Another request may have built the same tenant concurrently
+            existing = self._entries.get(tenant_id)
+            if existing is not None:
+                self._entries.move_to_end(tenant_id)
+                return existing
+
+            self._entries[tenant_id] = retriever
+            self._fingerprints[tenant_id] = (fingerprint, time.monotonic())
+            self._evict()
+
+        print(f"Built vector index for tenant {tenant_id} in {elapsed * 1000:.1f} ms")
+        return retriever
+
+    def add_chunks(self, tenant_id: str, chunks: List[Dict[str, Any]], embeddings: List[Any]):
+        """Append newly stored chunks to a tenant's cached retriever, if any"""
+        fingerprint = tenant_chunk_fingerprint(tenant_id)
+        with self._lock:
+            retriever = self._entries.get(tenant_id)
+            if retriever is None:
+                self._bump_generation(tenant_id)
+                return
+            try:
+                retriever.add(chunks, embeddings)
+            except Exception as e:
+                print(f"Error updating vector index for tenant {tenant_id}, rebuilding it on the next query: {e}")
+                self.invalidate(tenant_id)
+                return
+            self._mark_fresh(tenant_id, fingerprint)
+            self._evict()
+
+    def remove_document(self, tenant_id: str, document_id: str):
+        """Drop a document's chunks from a tenant's cached retriever, if any"""
+        fingerprint = tenant_chunk_fingerprint(tenant_id)
+        with self._lock:
+            retriever = self._entries.get(tenant_id)
+            if retriever is None:
+                self._bump_generation(tenant_id)
+                return
+            try:
+                retriever.remove_document(document_id)
+            except Exception as e:
+                print(f"Error updating vector index for tenant {tenant_id}, rebuilding it on the next query: {e}")
+                self.invalidate(tenant_id)
+                return
+            self._mark_fresh(tenant_id, fingerprint)
+            if retriever.needs_rebuild():
+                # Too many tombstones, rebuild from the database on the next query
+                self.invalidate(tenant_id)
+
+    def replace_document(self, tenant_id: str, document_id: str, chunks: List[Dict[str, Any]], embeddings: List[Any]):
+        """Swap a document's chunks in a tenant's cached retriever for a new set, if cached"""
+        fingerprint = tenant_chunk_fingerprint(tenant_id)
+        with self._lock:
+            retriever = self._entries.get(tenant_id)
+            if retriever is None:
+                self._bump_generation(tenant_id)
+                return
+            try:
+                retriever.replace_document(document_id, chunks, embeddings)
+            except Exception as e:
+                print(f"Error updating vector index for tenant {tenant_id}, rebuilding it on the next query: {e}")
+                self.invalidate(tenant_id)
+                return
+            self._mark_fresh(tenant_id, fingerprint)
+            if retriever.needs_rebuild():
+                # Too many tombstones, rebuild from the database on the next query
+                self.invalidate(tenant_id)
+            else:
+                self._evict()
+
+    def invalidate(self, tenant_id: str):
+        """Forget a tenant's retriever so the next query rebuilds it"""
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+            self._fingerprints.pop(tenant_id, None)
+            self._bump_generation(tenant_id)
+
+    def memory_usage(self) -> int:
+        """Approximate number of bytes held by all cached retrievers"""
+        with self._lock:
+            return sum(retriever.memory_bytes() for retriever in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tenants_cached": len(self._entries),
+                "memory_bytes": self.memory_usage(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "builds": self.builds,
+                "evictions": self.evictions,
+                "build_time_total_ms": self.build_time_total * 1000,
+                "last_build_time_ms": self.last_build_time * 1000,
+            }
+
+    def _mark_fresh(self, tenant_id: str, fingerprint: Optional[Tuple[int, int]]):
+        """Record that a cached retriever includes the local change that produced fingerprint"""
+        self._fingerprints[tenant_id] = (fingerprint, time.monotonic())
+
+    def _bump_generation(self, tenant_id: str):
+        self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+
+    def _evict(self):
+        """Evict least recently used tenants until we are within the memory budget"""
+        total = self.memory_usage()
+        # Always keep the most recently used tenant, even if it alone exceeds the budget
+        while total > self.memory_budget_bytes and len(self._entries) > 1:
+            tenant_id, retriever = self._entries.popitem(last=False)
+            self._fingerprints.pop(tenant_id, None)
+            total -= retriever.memory_bytes()
+            self.evictions += 1
+            print(f"Evicted vector index for tenant {tenant_id} to stay within memory budget")
+
+def tenant_chunk_fingerprint(tenant_id: str) -> Tuple[int, int]:
+    """
+    Cheap fingerprint of a tenant's stored chunks: their count and highest rowid.
+    Inserting, replacing or deleting chunks changes it; answered from the
+    (tenant_id, content_hash) index without reading the rows.
+    """
+    db = get_sqlite_client()
+    with db.read_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM document_chunks WHERE tenant_id = ?",
+            (tenant_id,)
+        ).fetchone()
+    return (row[0], row[1])
+
+def index_version(chunk_ids: List[str], index_type: str) -> str:
+    """
+    Fingerprint a tenant's set of embedded chunks.
+    Any added or removed chunk, or a different index type, yields a new version.
+    """
+    digest = hashlib.sha1(index_type.encode('utf-8'))
+    for chunk_id in sorted(chunk_ids):
+        digest.update(b'\n')
+        digest.update(chunk_id.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def index_file_path(tenant_id: str, version: str) -> str:
+    """Path of a tenant's saved index file for a given version"""
+    os.makedirs(settings.VECTOR_INDEX_DIR, exist_ok=True)
+    return os.path.join(settings.VECTOR_INDEX_DIR, f"{tenant_id}.{version}.faiss")
+
+def remove_stale_index_files(tenant_id: str, version: str):
+    """
+    Delete a tenant's index data and metadata files for other versions.
+    Workers that still have an old file mapped keep reading it until they close it.
+    """
+    current = index_file_path(tenant_id, version)
+    for path in glob.glob(os.path.join(settings.VECTOR_INDEX_DIR, f"{tenant_id}.*.faiss*")):
+        if path.startswith(f"{current}."):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Create the shared registry instance
+tenant_index_registry = TenantIndexRegistry(settings.VECTOR_INDEX_MEMORY_BUDGET_MB * 1024 * 1024)
+
+def get_index_registry():
+    """Get the shared tenant index registry"""
+    return tenant_index_registry
@@ -0,0 +1,108 @@
+"""
+Recall-vs-latency report for the FAISS index types supported by FAISSRetriever,
+including the memory saved and recall lost by quantized indexes and int8 storage.
+
+Usage:
+    python benchmark_retrieval.py --tenant-id <tenant id>   # a tenant's stored embeddings
+    python benchmark_retrieval.py --synthetic 200000        # random unit vectors
+
+Use the output to pick VECTOR_INDEX_* settings, or per-tenant overrides in the
+"retrieval" key of a tenant's chat_widget_config (index_type, nprobe, ef_search).
+"""
+import argparse
+import time
+import numpy as np
+import faiss
+from app.services.llm import FAISSRetriever, load_tenant_embeddings, load_embedding_model
+from app.services.vector_codec import encode_embedding, decode_embedding
+
+def exact_neighbours(embeddings, queries, k):
+    """Ground-truth nearest neighbours from an exact index"""
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    _, indices = index.search(queries, k)
+    return indices
+
+def measure(retriever, queries, ground_truth, k):
+    """Return recall@k and latency percentiles (ms) over all queries"""
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        results = retriever.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(chunk['id']) for chunk, _ in results}
+        hits += len(found & set(expected.tolist()))
+    return hits / (len(queries) * k), np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS index recall-vs-latency report")
+    parser.add_argument("--tenant-id", help="Benchmark a tenant's stored embeddings")
+    parser.add_argument("--synthetic", type=int, default=50000, help="Number of random vectors to generate")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries to run")
+    parser.add_argument("-k", type=int, default=5, help="Number of neighbours per query")
+    args = parser.parse_args()
+    load_embedding_model()
+
+    rng = np.random.default_rng(0)
+    if args.tenant_id:
+        _, embeddings = load_tenant_embeddings(args.tenant_id)
+        embeddings = np.asarray(embeddings, dtype='float32')
+        print(f"Loaded {len(embeddings)} embeddings for tenant {args.tenant_id}")
+    else:
+        embeddings = rng.standard_normal((args.synthetic, 384)).astype('float32')
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        print(f"Generated {len(embeddings)} synthetic embeddings")
+
+    if len(embeddings) == 0:
+        print("No embeddings to benchmark")
+        return
+
+    # Queries are perturbed corpus vectors, similar to a question close to a stored chunk
+    picks = rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)
+    queries = embeddings[picks] + rng.normal(0, 0.05, (len(picks), embeddings.shape[1])).astype('float32')
+    ground_truth = exact_neighbours(embeddings, queries, args.k)
+
+    chunks = [{"id": str(i), "content": ""} for i in range(len(embeddings))]
+    # Re-ranking reads full-precision vectors; here they come from memory instead of the database
+    def vector_loader(chunk_ids):
+        return {chunk_id: embeddings[int(chunk_id)] for chunk_id in chunk_ids}
+
+    configs = [
+        ('flat', [{}], False),
+        ('sq8', [{}], False),
+        ('sq8', [{}], True),
+        ('pq', [{}], False),
+        ('pq', [{}], True),
+        ('hnsw', [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)], False),
+        ('ivf_flat', [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)], False),
+        ('ivf_pq', [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)], False),
+        ('ivf_pq', [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)], True),
+    ]
+
+    print(f"\n{'index':<10} {'params':<16} {'rerank':>6} {'build s':>8} {'mem MB':>8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for index_type, param_sets, rerank in configs:
+        retriever = FAISSRetriever(index_type=index_type)
+        if rerank:
+            retriever.vector_loader = vector_loader
+        start = time.perf_counter()
+        retriever.fit(chunks, embeddings, background=False)
+        build_time = time.perf_counter() - start
+
+        for params in param_sets:
+            retriever.set_search_params(**params)
+            recall, p50, p95 = measure(retriever, queries, ground_truth, args.k)
+            label = ', '.join(f"{key}={value}" for key, value in params.items()) or '-'
+            print(f"{retriever.index_type:<10} {label:<16} {'yes' if rerank else 'no':>6} {build_time:>8.2f} {retriever.memory_bytes() / 1e6:>8.1f} {recall:>10.3f} {p50:>8.3f} {p95:>8.3f}")
+
+    # Storage: exact search over vectors round-tripped through each BLOB encoding
+    print(f"\n{'storage':<10} {'bytes/vector':>12} {'total MB':>9} {'recall@' + str(args.k):>10}")
+    for dtype in ('float32', 'int8'):
+        blobs = [encode_embedding(embedding, dtype) for embedding in embeddings]
+        decoded = np.asarray([decode_embedding(blob) for blob in blobs], dtype='float32')
+        indices = exact_neighbours(decoded, queries, args.k)
+        recall = np.mean([len(set(found.tolist()) & set(expected.tolist())) / args.k for found, expected in zip(indices, ground_truth)])
+        print(f"{dtype:<10} {len(blobs[0]):>12} {sum(len(blob) for blob in blobs) / 1e6:>9.1f} {recall:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sqlite3
+import os
+import sys
+from pathlib import Path
+
+# Make the app package importable when run as a script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.vector_codec import encode_embedding, decode_embedding
+
+# Path to the SQLite database
+DB_PATH = 'data/app.db'
+
+# Number of rows converted per transaction
+BATCH_SIZE = 1000
+
+def run_migration():
+    """Convert JSON text embeddings in document_chunks to packed float32 BLOBs"""
+    # Get the absolute path to the database
+    script_dir = Path(__file__).parent.parent  # Go up one level from migrations/
+    db_path = script_dir / DB_PATH
+
+    print(f"Running migration to convert document_chunks embeddings to float32 BLOBs")
+    print(f"Database path: {db_path}")
+
+    # Check if database exists
+    if not os.path.exists(db_path):
+        print(f"Error: Database not found at {db_path}")
+        return False
+
+    try:
+        # Connect to the database
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        # The column keeps its declared TEXT type on existing databases; SQLite
+        # stores BLOB values as-is regardless of column affinity
+        cursor.execute("SELECT COUNT(*) FROM document_chunks WHERE typeof(embedding) = 'text'")
+        remaining = cursor.fetchone()[0]
+
+        if remaining == 0:
+            print("No JSON embeddings left to convert")
+            conn.close()
+            return True
+
+        print(f"Converting {remaining} embeddings")
+        converted = 0
+        failed = 0
+        last_rowid = 0
+
+        while True:
+            cursor.execute(
+                "SELECT rowid, embedding FROM document_chunks "
+                "WHERE typeof(embedding) = 'text' AND rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, BATCH_SIZE)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for rowid, embedding_json in rows:
+                try:
+                    embedding = decode_embedding(embedding_json)
+                    updates.append((encode_embedding(embedding) if embedding is not None else None, rowid))
+                except ValueError as e:
+                    print(f"Skipping chunk with rowid {rowid}: {e}")
+                    failed += 1
+
+            # One transaction per batch
+            cursor.executemany("UPDATE document_chunks SET embedding = ? WHERE rowid = ?", updates)
+            conn.commit()
+
+            converted += len(updates)
+            last_rowid = rows[-1][0]
+            print(f"Converted {converted}/{remaining} embeddings")
+
+        print(f"Successfully converted {converted} embeddings ({failed} skipped)")
+        conn.close()
+        return True
+
+    except Exception as e:
+        print(f"Error running migration: {e}")
+        return False
+
+if __name__ == "__main__":
+    run_migration()
@@ -38,6 +38,8 @@ CREATE TABLE IF NOT EXISTS documents (
     tenant_id UUID NOT NULL REFERENCES tenants(id),
     is_processed BOOLEAN DEFAULT FALSE,
     embedding_status TEXT DEFAULT 'pending',
+    file_size BIGINT,
+    content_hash TEXT,
     created_at TIMESTAMPTZ NOT NULL,
     updated_at TIMESTAMPTZ NOT NULL
 );